@@ -1,20 +1,30 @@
 from __future__ import annotations
 
 import argparse
+import ctypes
+import ctypes.util
+import functools
 import os
+import secrets
+import select
 import signal
 import subprocess
 import sys
 import time
-import uuid
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Mapping, TextIO, Tuple
 
+from mcp import daemon
 from mcp.event_bus import EVENT_BUS
-from mcp.orchestrator.planner import CodexPlanner, PlanError
+from mcp.orchestrator.planner import CodexPlanner, PlanError, plan_cache_enabled
 from mcp.orchestrator.roles import RolePlanner
-from mcp.store import TaskStore
+from mcp.orchestrator.worker_monitor import is_alive, wait_exit
+from mcp.store import FINAL_STATUSES, TaskStore
 from mcp.terminal.manager import TerminalManager
+from mcp.utils import fast_json
+
+
+_KILL_GRACE = 5.0
 
 
 def _runs_dir() -> Path:
@@ -22,46 +32,117 @@ def _runs_dir() -> Path:
 
 
 def _store_path() -> Path:
-    return Path(os.environ.get("MCP_STORE_PATH", "store/tasks.db")).resolve()
+    return _resolve(os.environ.get("MCP_STORE_PATH", "store/tasks.db"))
+
+
+@functools.lru_cache(maxsize=8)
+def _resolve(raw: str) -> Path:
+    # Clé = valeur brute de l'environnement ; realpath() n'est payé qu'une fois.
+    return Path(raw).resolve()
+
+
+def reset_path_cache() -> None:
+    """Forget memoized path resolutions (after a chdir, e.g. in tests)."""
+    _resolve.cache_clear()
 
 
 def _launch_task(objective: str, max_parallel: int | None) -> int:
     del max_parallel  # placeholder until scheduler implémente le parallélisme
+    if _daemon_requested():
+        exit_code = _launch_via_daemon(objective)
+        if exit_code is not None:
+            return exit_code
+        print("Démon Numerus indisponible, exécution locale", file=sys.stderr)
     store_path = _store_path()
     os.environ["MCP_STORE_PATH"] = str(store_path)
-    store = TaskStore()
-    task_id = uuid.uuid4().hex[:8]
     runs_root = _runs_dir()
+    codex_bin = os.environ.get("CODEX_BIN", "codex")
+    launched = launch_job(
+        objective,
+        runs_root=runs_root,
+        store_path=store_path,
+        codex_bin=codex_bin,
+        manager=TerminalManager(runs_dir=runs_root, codex_bin=codex_bin),
+    )
+    return 0 if launched else 1
+
+
+def _daemon_requested() -> bool:
+    return os.environ.get("MCP_DAEMON", "") not in ("", "0")
+
+
+def _launch_via_daemon(objective: str) -> int | None:
+    # Le démon sert plusieurs projets : chemins absolus, cwd et env du client voyagent avec la requête.
+    payload = {
+        "op": "run",
+        "objective": objective,
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+        "runs_dir": str(_resolve(str(_runs_dir()))),
+        "store_path": str(_store_path()),
+        "codex_bin": os.environ.get("CODEX_BIN", "codex"),
+    }
+    exit_code = daemon.request(payload)
+    if exit_code is None and daemon.spawn():
+        exit_code = daemon.request(payload)
+    return exit_code
+
+
+def launch_job(
+    objective: str,
+    *,
+    runs_root: Path,
+    store_path: Path,
+    codex_bin: str,
+    manager: TerminalManager,
+    base_env: Mapping[str, str] | None = None,
+    cwd: str | None = None,
+    out: TextIO | None = None,
+    err: TextIO | None = None,
+) -> Tuple[str, int] | None:
+    """Plan ``objective`` and spawn its worker; return ``(task_id, worker_pid)``."""
+    out = out or sys.stdout
+    err = err or sys.stderr
+    store = TaskStore.instance(store_path)
+    task_id = secrets.token_hex(4)
     job_dir = runs_root / task_id
     job_dir.mkdir(parents=True, exist_ok=True)
 
-    codex_bin = os.environ.get("CODEX_BIN", "codex")
-    planner_manager = TerminalManager(runs_dir=runs_root, codex_bin=codex_bin)
-    planner = CodexPlanner(planner_manager)
+    # Sous le démon, l'environnement qui compte est celui du client, pas os.environ.
+    environ = os.environ if base_env is None else base_env
+
+    # Le gestionnaire (partagé par le démon) a l'environnement du démon : celui du
+    # client accompagne explicitement chaque exécution codex de planification.
+    planner = CodexPlanner(manager, cache_path=runs_root / ".plan_cache.json", env=base_env)
     try:
-        plan = planner.generate_plan(objective=objective, job_id=task_id)
+        plan = planner.generate_plan(
+            objective=objective,
+            job_id=task_id,
+            use_cache=plan_cache_enabled(environ),
+        )
     except PlanError as exc:
-        print(f"Échec de la planification : {exc}", file=sys.stderr)
-        return 1
+        print(f"Échec de la planification : {exc}", file=err)
+        return None
 
-    role_planner = RolePlanner(planner_manager)
+    role_planner = RolePlanner(manager, env=base_env)
     assignments = role_planner.assign(plan, job_id=task_id)
     for task in plan.tasks:
         if task.task_id in assignments:
             task.role = assignments[task.task_id].role
 
+    plan_dict = plan.to_dict()
     plan_path = job_dir / "plan.json"
-    plan_path.write_text(plan.to_json(), encoding="utf-8")
-    print(f"Plan ({len(plan.tasks)} tâche(s)) → {plan_path}")
+    plan_path.write_bytes(fast_json.dumps_bytes(plan_dict, indent=True))
+    print(f"Plan ({len(plan.tasks)} tâche(s)) → {plan_path}", file=out)
     for task in plan.tasks:
-        print(f"  - {task.task_id} [{task.role}]: {task.summary}")
+        print(f"  - {task.task_id} [{task.role}]: {task.summary}", file=out)
     EVENT_BUS.emit(
         "job.plan_created",
         {
             "job_id": task_id,
             "objective": objective,
             "plan_path": str(plan_path),
-            "tasks": [task.to_dict() for task in plan.tasks],
+            "tasks": plan_dict["tasks"],
         },
     )
 
@@ -73,14 +154,22 @@ def _launch_task(objective: str, max_parallel: int | None) -> int:
         mode="exec",
     )
 
-    env = os.environ.copy()
-    env.setdefault("MCP_RUNS_DIR", str(runs_root.resolve()))
-    env.setdefault("MCP_STORE_PATH", str(store_path))
-    env.setdefault("CODEX_BIN", codex_bin)
+    worker_env = {
+        "MCP_RUNS_DIR": str(_resolve(str(runs_root))),
+        "MCP_STORE_PATH": str(store_path),
+        "CODEX_BIN": codex_bin,
+    }
+    # Le worker hérite de os.environ tel quel ; on ne copie que s'il manque une clé.
+    overrides = {key: value for key, value in worker_env.items() if key not in environ}
+    env = None if base_env is None and not overrides else {**environ, **overrides}
     worker_cmd: List[str] = [sys.executable, "-m", "mcp.orchestrator.worker", task_id]
-    process = subprocess.Popen(worker_cmd, env=env, start_new_session=True)
+    # Tous nos fds (sqlite, pty, pipes, sockets) sont non héritables : inutile que le
+    # fils parcoure /proc/self/fd pour les fermer.
+    process = subprocess.Popen(worker_cmd, env=env, cwd=cwd, close_fds=False, start_new_session=True)
     store.update_fields(task_id, worker_pid=process.pid, status="running")
-    print(f"task {task_id} started")
+    # Le PID doit être visible avant que le worker n'écrive ses propres statuts.
+    store.flush()
+    print(f"task {task_id} started", file=out)
     EVENT_BUS.emit(
         "job.started",
         {
@@ -90,7 +179,7 @@ def _launch_task(objective: str, max_parallel: int | None) -> int:
             "worker_pid": process.pid,
         },
     )
-    return 0
+    return task_id, process.pid
 
 
 def cmd_run(args: argparse.Namespace) -> int:
@@ -113,10 +202,16 @@ def cmd_start(args: argparse.Namespace) -> int:
 
 def cmd_status(args: argparse.Namespace) -> int:
     os.environ.setdefault("MCP_STORE_PATH", str(_store_path()))
-    store = TaskStore()
+    store = TaskStore.instance()
     runs_dir = _runs_dir()
 
     rows = store.list()
+    for row in rows:
+        # Un worker mort sans avoir écrit son statut final laisse une ligne périmée.
+        if row.status not in FINAL_STATUSES and row.worker_pid and not is_alive(row.worker_pid):
+            row.status = "killed" if row.status == "terminating" else "failed"
+            row.error = row.error or "worker exited"
+            store.update_fields(row.task_id, status=row.status, error=row.error)
     header = f"{'Task':<12} {'Status':<12} {'Created':<10} {'Updated':<10} {'PID':<8} {'Exit':<6} Workdir"
     print(header)
     print("-" * len(header))
@@ -132,6 +227,51 @@ def cmd_status(args: argparse.Namespace) -> int:
     return 0
 
 
+_IN_MODIFY = 0x00000002
+
+
+def _inotify_watch(path: Path) -> int | None:
+    """Return a non-blocking inotify fd watching ``path`` for writes, or None."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(path), _IN_MODIFY) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _tail_follow(path: Path) -> Iterator[str]:
+    """Yield lines appended to ``path``, sleeping on inotify rather than polling."""
+    # Le watch est posé avant l'ouverture : aucune écriture ne peut être manquée.
+    watch_fd = _inotify_watch(path)
+    try:
+        with path.open("r", encoding="utf-8", errors="replace") as fp:
+            fp.seek(0, os.SEEK_END)
+            while True:
+                line = fp.readline()
+                if line:
+                    yield line
+                    continue
+                if watch_fd is None:
+                    time.sleep(0.5)
+                    continue
+                select.select([watch_fd], [], [])
+                try:
+                    os.read(watch_fd, 4096)
+                except BlockingIOError:
+                    pass
+    finally:
+        if watch_fd is not None:
+            os.close(watch_fd)
+
+
 def cmd_logs(args: argparse.Namespace) -> int:
     task_id = args.task_id
     runs_dir = _runs_dir()
@@ -142,25 +282,19 @@ def cmd_logs(args: argparse.Namespace) -> int:
 
     if args.follow:
         print(f"--- tailing {stdout_path} ---")
-        with stdout_path.open("r", encoding="utf-8") as fp:
-            fp.seek(0, os.SEEK_END)
-            try:
-                while True:
-                    line = fp.readline()
-                    if line:
-                        print(line.rstrip("\n"))
-                    else:
-                        time.sleep(0.5)
-            except KeyboardInterrupt:
-                return 0
+        try:
+            for line in _tail_follow(stdout_path):
+                print(line.rstrip("\n"))
+        except KeyboardInterrupt:
+            return 0
     else:
-        print(stdout_path.read_text(encoding="utf-8"))
+        print(stdout_path.read_text(encoding="utf-8", errors="replace"))
     return 0
 
 
 def cmd_kill(args: argparse.Namespace) -> int:
     os.environ.setdefault("MCP_STORE_PATH", str(_store_path()))
-    store = TaskStore()
+    store = TaskStore.instance()
     row = store.get(args.task_id)
     if not row:
         print(f"Task {args.task_id} not found", file=sys.stderr)
@@ -172,10 +306,23 @@ def cmd_kill(args: argparse.Namespace) -> int:
         os.kill(row.worker_pid, signal.SIGTERM)
         store.update_fields(args.task_id, status="terminating")
         print(f"Sent SIGTERM to task {args.task_id} (pid {row.worker_pid})")
-        return 0
     except ProcessLookupError:
         print(f"Worker process {row.worker_pid} missing", file=sys.stderr)
         return 1
+    if not wait_exit(row.worker_pid, _KILL_GRACE):
+        try:
+            os.kill(row.worker_pid, signal.SIGKILL)
+            print(f"Worker still alive after {_KILL_GRACE:.0f}s, sent SIGKILL")
+        except ProcessLookupError:
+            pass
+        wait_exit(row.worker_pid, _KILL_GRACE)
+    store.update_fields(args.task_id, status="killed")
+    return 0
+
+
+def cmd_daemon(args: argparse.Namespace) -> int:
+    del args
+    return daemon.main()
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -204,6 +351,9 @@ def build_parser() -> argparse.ArgumentParser:
     kill_parser.add_argument("task_id")
     kill_parser.set_defaults(func=cmd_kill)
 
+    daemon_parser = subparsers.add_parser("daemon", help="Démon longue durée servant `run` (MCP_DAEMON=1)")
+    daemon_parser.set_defaults(func=cmd_daemon)
+
     return parser
 
 
@@ -0,0 +1,221 @@
+"""Long-lived Numerus daemon keeping Codex planners warm behind a UNIX socket."""
+
+from __future__ import annotations
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, TextIO, Tuple
+
+from mcp.orchestrator.worker_monitor import WorkerMonitor
+from mcp.store import FINAL_STATUSES, TaskStore
+from mcp.terminal.manager import TerminalManager
+from mcp.utils import fast_json
+
+_SPAWN_TIMEOUT = 5.0
+
+
+def socket_path() -> Path:
+    explicit = os.environ.get("MCP_DAEMON_SOCKET")
+    if explicit:
+        return Path(explicit)
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "mcp.sock"
+    return Path(tempfile.gettempdir()) / f"mcp-{os.getuid()}.sock"
+
+
+def _send(fp: BinaryIO, message: Dict[str, object]) -> None:
+    fp.write(fast_json.dumps_line(message))
+    fp.flush()
+
+
+def request(
+    payload: Dict[str, object],
+    *,
+    stdout: Optional[TextIO] = None,
+    stderr: Optional[TextIO] = None,
+) -> Optional[int]:
+    """Send one request and relay the daemon output; None if no daemon listens."""
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path()))
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    with sock, sock.makefile("rwb") as fp:
+        _send(fp, payload)
+        for line in fp:
+            message = fast_json.loads(line)
+            if "exit" in message:
+                return int(message["exit"])
+            stream = stdout if message.get("stream") == "stdout" else stderr
+            stream.write(str(message.get("text", "")))
+            stream.flush()
+    print("Connexion au démon interrompue", file=stderr)
+    return 1
+
+
+def spawn() -> bool:
+    """Start a detached daemon and wait until it answers a ping."""
+    path = socket_path()
+    log_path = path.with_suffix(".log")
+    with log_path.open("ab") as log:
+        subprocess.Popen(
+            [sys.executable, "-m", "mcp.daemon"],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            close_fds=False,
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + _SPAWN_TIMEOUT
+    while time.monotonic() < deadline:
+        if request({"op": "ping"}) == 0:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class _StreamWriter:
+    """File-like object forwarding writes to the client as JSON lines."""
+
+    def __init__(self, fp: BinaryIO, stream: str) -> None:
+        self._fp = fp
+        self._stream = stream
+
+    def write(self, text: str) -> int:
+        if text:
+            _send(self._fp, {"stream": self._stream, "text": text})
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+class Daemon:
+    """Serve `run` requests with cached TerminalManagers and reap the workers."""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+        self._managers: Dict[Tuple[str, str], TerminalManager] = {}
+        self._jobs: Dict[str, TaskStore] = {}
+        self._monitor = WorkerMonitor(self._on_worker_exit)
+
+    def serve_forever(self) -> None:
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        server.bind(str(self._path))
+        os.chmod(self._path, 0o600)
+        server.listen()
+        try:
+            while True:
+                conn, _ = server.accept()
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            server.close()
+            self._path.unlink(missing_ok=True)
+
+    def _handle(self, conn: socket.socket) -> None:
+        with conn, conn.makefile("rwb") as fp:
+            line = fp.readline()
+            if not line:
+                return
+            out = _StreamWriter(fp, "stdout")
+            err = _StreamWriter(fp, "stderr")
+            try:
+                payload = fast_json.loads(line)
+                op = payload.get("op")
+                if op == "ping":
+                    exit_code = 0
+                elif op == "run":
+                    exit_code = self._run(payload, out, err)
+                else:
+                    print(f"Opération inconnue : {op}", file=err)
+                    exit_code = 2
+            except Exception as exc:  # noqa: BLE001 - l'erreur est renvoyée au client
+                print(f"Erreur du démon : {exc}", file=err)
+                exit_code = 1
+            try:
+                _send(fp, {"exit": exit_code})
+            except OSError:
+                pass
+
+    def _manager_for(self, runs_root: Path, codex_bin: str) -> TerminalManager:
+        key = (str(runs_root), codex_bin)
+        with self._lock:
+            manager = self._managers.get(key)
+            if manager is None:
+                manager = TerminalManager(runs_dir=runs_root, codex_bin=codex_bin)
+                self._managers[key] = manager
+        return manager
+
+    def _run(self, payload: Dict[str, object], out: TextIO, err: TextIO) -> int:
+        # Import différé : mcp.cli.app importe ce module.
+        from mcp.cli.app import launch_job
+
+        runs_root = Path(str(payload["runs_dir"]))
+        store_path = Path(str(payload["store_path"]))
+        codex_bin = str(payload.get("codex_bin") or "codex")
+        launched = launch_job(
+            str(payload["objective"]),
+            runs_root=runs_root,
+            store_path=store_path,
+            codex_bin=codex_bin,
+            manager=self._manager_for(runs_root, codex_bin),
+            base_env=payload.get("env") or {},
+            cwd=payload.get("cwd"),
+            out=out,
+            err=err,
+        )
+        if launched is None:
+            return 1
+        task_id, worker_pid = launched
+        with self._lock:
+            self._jobs[task_id] = TaskStore.instance(store_path)
+        self._monitor.watch(task_id, worker_pid)
+        return 0
+
+    def _on_worker_exit(self, task_id: str, exit_code: Optional[int]) -> None:
+        with self._lock:
+            store = self._jobs.pop(task_id, None)
+        if store is None:
+            return
+        row = store.get(task_id)
+        if row and row.status not in FINAL_STATUSES:
+            store.update_fields(task_id, status="failed", exit_code=exit_code, error="worker exited")
+
+
+def main() -> int:
+    path = socket_path()
+    if path.exists():
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(path))
+        except (ConnectionRefusedError, FileNotFoundError):
+            path.unlink(missing_ok=True)
+        else:
+            print(f"Un démon écoute déjà sur {path}", file=sys.stderr)
+            return 1
+        finally:
+            probe.close()
+    # Chaque requête porte ses propres chemins : on ignore ceux hérités du lanceur.
+    for key in ("MCP_RUNS_DIR", "MCP_STORE_PATH"):
+        os.environ.pop(key, None)
+    try:
+        Daemon(path).serve_forever()
+    except KeyboardInterrupt:
+        return 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
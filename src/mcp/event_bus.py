@@ -1,10 +1,11 @@
 from __future__ import annotations
 
+import atexit
 import threading
 import time
 from collections import defaultdict
 from dataclasses import dataclass
-from typing import Callable, Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 
 EventHandler = Callable[[Dict[str, object]], None]
@@ -15,27 +16,36 @@ class EventStats:
     event: str
     count: int
     last_emitted: Optional[float]
+    dropped: int = 0
 
 
 class EventBus:
     """Simple in-process event bus with metrics tracking."""
 
     def __init__(self, *, debug: bool = False) -> None:
-        self._listeners: Dict[str, List[EventHandler]] = defaultdict(list)
-        self._lock = threading.RLock()
+        # Copy-on-write : chaque abonnement remplace le tuple, emit le lit sans verrou.
+        self._listeners: Dict[str, Tuple[EventHandler, ...]] = {}
+        self._lock = threading.Lock()
         self._counts: Dict[str, int] = defaultdict(int)
         self._last_emitted: Dict[str, float] = {}
+        self._dropped: Dict[str, int] = defaultdict(int)
         self._debug = debug
 
     def emit(self, event: str, payload: Optional[Dict[str, object]] = None) -> None:
         if payload is None:
             payload = {}
+        self._record(event, payload)
+        self._dispatch(self._listeners.get(event, ()), payload)
+
+    def _record(self, event: str, payload: Dict[str, object]) -> None:
         with self._lock:
-            listeners = list(self._listeners.get(event, []))
             self._counts[event] += 1
             self._last_emitted[event] = time.time()
         if self._debug:
             print(f"[EventBus] {event}: {payload}")
+
+    @staticmethod
+    def _dispatch(listeners: Tuple[EventHandler, ...], payload: Dict[str, object]) -> None:
         for handler in listeners:
             try:
                 handler(payload)
@@ -45,17 +55,33 @@ class EventBus:
 
     def subscribe(self, event: str, handler: EventHandler) -> Callable[[], None]:
         with self._lock:
-            self._listeners[event].append(handler)
+            self._listeners[event] = self._listeners.get(event, ()) + (handler,)
 
         def unsubscribe() -> None:
             with self._lock:
-                handlers = self._listeners.get(event)
-                if handlers and handler in handlers:
-                    handlers.remove(handler)
+                handlers = self._listeners.get(event, ())
+                if handler not in handlers:
+                    return
+                index = handlers.index(handler)
+                remaining = handlers[:index] + handlers[index + 1 :]
+                if remaining:
+                    self._listeners[event] = remaining
+                else:
+                    del self._listeners[event]
         return unsubscribe
 
+    def has_subscribers(self, event: str) -> bool:
+        """Tell whether ``event`` currently has handlers (lock-free read)."""
+        return event in self._listeners
+
     def once(self, event: str, handler: EventHandler) -> Callable[[], None]:
+        # Le ring copie les handlers à l'émission : deux événements en file
+        # atteignent tous deux ce wrapper, d'où le drapeau sous verrou.
+        fired = threading.Lock()
+
         def wrapper(payload: Dict[str, object]) -> None:
+            if not fired.acquire(blocking=False):
+                return
             unsubscribe()
             handler(payload)
 
@@ -80,7 +106,12 @@ class EventBus:
     def get_stats(self) -> List[EventStats]:
         with self._lock:
             return [
-                EventStats(event=event, count=count, last_emitted=self._last_emitted.get(event))
+                EventStats(
+                    event=event,
+                    count=count,
+                    last_emitted=self._last_emitted.get(event),
+                    dropped=self._dropped.get(event, 0),
+                )
                 for event, count in self._counts.items()
             ]
 
@@ -88,8 +119,83 @@ class EventBus:
         with self._lock:
             self._counts.clear()
             self._last_emitted.clear()
+            self._dropped.clear()
+
+
+class RingBus(EventBus):
+    """Event bus whose handlers run on a dedicated thread fed by a bounded ring.
+
+    ``emit`` only records the event and stores it in the ring; when the ring is
+    full the event is dropped and counted in ``get_stats``. ``emit_sync`` keeps
+    the synchronous behaviour for callers that need ordering.
+    """
+
+    def __init__(self, *, size: int = 1024, debug: bool = False) -> None:
+        if size <= 0 or size & (size - 1):
+            raise ValueError("La taille du ring doit être une puissance de deux")
+        super().__init__(debug=debug)
+        self._ring: List[Optional[Tuple[Tuple[EventHandler, ...], Dict[str, object]]]] = [None] * size
+        self._mask = size - 1
+        self._head = 0
+        self._tail = 0
+        # Plusieurs threads émettent (watchers, runner, CLI) : les producteurs
+        # se sérialisent sur un verrou court, jamais pendant l'exécution des handlers.
+        self._ring_lock = threading.Lock()
+        self._ready = threading.Condition(self._ring_lock)
+        self._idle = threading.Condition(self._ring_lock)
+        self._consumer = threading.Thread(target=self._drain, name="event-bus", daemon=True)
+        self._consumer.start()
+        atexit.register(self.flush, 1.0)
+
+    def emit(self, event: str, payload: Optional[Dict[str, object]] = None) -> None:
+        if payload is None:
+            payload = {}
+        self._record(event, payload)
+        listeners = self._listeners.get(event, ())
+        if not listeners:
+            return
+        with self._ring_lock:
+            if self._head - self._tail > self._mask:
+                dropped = True
+            else:
+                dropped = False
+                self._ring[self._head & self._mask] = (listeners, payload)
+                self._head += 1
+                self._ready.notify()
+        if dropped:
+            with self._lock:
+                self._dropped[event] += 1
+
+    def emit_sync(self, event: str, payload: Optional[Dict[str, object]] = None) -> None:
+        """Run the handlers on the calling thread, bypassing the ring."""
+        super().emit(event, payload)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued event has been dispatched."""
+        if threading.current_thread() is self._consumer:
+            return self._tail == self._head
+        with self._idle:
+            return self._idle.wait_for(lambda: self._tail == self._head, timeout)
+
+    def _drain(self) -> None:
+        while True:
+            with self._ready:
+                while self._tail == self._head:
+                    self._idle.notify_all()
+                    self._ready.wait()
+                start, end = self._tail, self._head
+                batch = []
+                for index in range(start, end):
+                    slot = index & self._mask
+                    batch.append(self._ring[slot])
+                    self._ring[slot] = None
+            for listeners, payload in batch:
+                self._dispatch(listeners, payload)
+            # La place n'est rendue qu'après dispatch : le ring borne aussi le travail en cours.
+            with self._ring_lock:
+                self._tail = end
 
 
 # Singleton instance used across Numerus
-EVENT_BUS = EventBus()
+EVENT_BUS = RingBus()
 
@@ -1,16 +1,22 @@
 from __future__ import annotations
 
-import json
+import atexit
+import itertools
+import queue
+import secrets
 import sqlite3
 import threading
 import time
-import uuid
+from collections import OrderedDict
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from mcp.event_bus import EVENT_BUS
-from mcp.utils import retry_call
+from mcp.utils import fast_json, retry_call
+from mcp.utils.sqlite_pragmas import WAL_PRAGMAS
+
+_WRITE_BATCH_MAX = 256
 
 
 @dataclass
@@ -29,11 +35,33 @@ class MemoryManager:
         self._db_path = Path(db_path)
         self._db_path.parent.mkdir(parents=True, exist_ok=True)
         self._cache_size = cache_size
+        # Préfixe aléatoire par processus (workers concurrents sur la même base) + compteur local.
+        self._entry_prefix = f"mem-{secrets.token_hex(4)}-"
+        self._entry_counter = itertools.count(1)
         self._lock = threading.RLock()
-        self._connection = sqlite3.connect(self._db_path, check_same_thread=False)
-        self._connection.row_factory = sqlite3.Row
+        self._local = threading.local()
+        self._connection = self._connect()
         self._ensure_schema()
-        self._cache: Dict[str, MemoryEntry] = {}
+        self._cache: OrderedDict[str, MemoryEntry] = OrderedDict()
+        self._write_queue: queue.Queue[Tuple[str, str, str, str, float]] = queue.Queue()
+        self._writer = threading.Thread(target=self._drain_writes, name="memory-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self._db_path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        for pragma in WAL_PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    def _reader(self) -> sqlite3.Connection:
+        # WAL autorise des lectures concurrentes : une connexion de lecture par thread.
+        connection = getattr(self._local, "reader", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.reader = connection
+        return connection
 
     def _ensure_schema(self) -> None:
         with self._connection:
@@ -58,9 +86,17 @@ class MemoryManager:
                 )
                 """
             )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_bank_type_created "
+                "ON entries(bank_id, entry_type, created_at DESC)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_bank_created "
+                "ON entries(bank_id, created_at DESC)"
+            )
 
     def ensure_bank(self, label: str) -> str:
-        bank_id = f"bank-{uuid.uuid4().hex[:8]}"
+        bank_id = f"bank-{secrets.token_hex(4)}"
         def _op() -> None:
             with self._lock, self._connection:
                 self._connection.execute(
@@ -86,21 +122,15 @@ class MemoryManager:
         data: Dict[str, object],
     ) -> MemoryEntry:
         entry = MemoryEntry(
-            entry_id=f"mem-{uuid.uuid4().hex[:8]}",
+            entry_id=f"{self._entry_prefix}{next(self._entry_counter):x}",
             bank_id=bank_id,
             entry_type=entry_type,
             data=data,
             created_at=time.time(),
         )
-        payload = json.dumps(entry.data, ensure_ascii=False)
-        def _op() -> None:
-            with self._lock, self._connection:
-                self._connection.execute(
-                    "INSERT INTO entries (entry_id, bank_id, entry_type, data, created_at) VALUES (?, ?, ?, ?, ?)",
-                    (entry.entry_id, entry.bank_id, entry.entry_type, payload, entry.created_at),
-                )
-
-        retry_call(_op, attempts=3, delay=0.2, exceptions=(sqlite3.OperationalError,))
+        payload = fast_json.dumps_bytes(entry.data).decode("utf-8")
+        # Écriture différée : le thread writer regroupe les inserts en une transaction.
+        self._write_queue.put((entry.entry_id, entry.bank_id, entry.entry_type, payload, entry.created_at))
         self._add_cache(entry)
         EVENT_BUS.emit(
             "memory.entry_added",
@@ -121,6 +151,7 @@ class MemoryManager:
     ) -> List[MemoryEntry]:
         sql = "SELECT * FROM entries WHERE bank_id = ?"
         params: List[object] = [bank_id]
+        self.flush()
         if entry_type:
             sql += " AND entry_type = ?"
             params.append(entry_type)
@@ -128,26 +159,75 @@ class MemoryManager:
         if limit:
             sql += " LIMIT ?"
             params.append(limit)
+        rows = self._reader().execute(sql, params).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def flush(self) -> None:
+        """Block until every queued entry has been written to SQLite."""
+        self._write_queue.join()
+
+    def _drain_writes(self) -> None:
+        while True:
+            batch = [self._write_queue.get()]
+            while len(batch) < _WRITE_BATCH_MAX:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            def _op() -> None:
+                with self._lock, self._connection:
+                    self._connection.executemany(
+                        "INSERT INTO entries (entry_id, bank_id, entry_type, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                        batch,
+                    )
+
+            try:
+                retry_call(_op, attempts=3, delay=0.2, exceptions=(sqlite3.OperationalError,))
+            except Exception as exc:  # noqa: BLE001 - le writer ne doit jamais mourir
+                EVENT_BUS.emit(
+                    "memory.write_failed",
+                    {
+                        "entries": [row[0] for row in batch],
+                        "error": str(exc),
+                    },
+                )
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+
+    def get(self, entry_id: str) -> Optional[MemoryEntry]:
         with self._lock:
-            rows = self._connection.execute(sql, params).fetchall()
-        entries = [
-            MemoryEntry(
-                entry_id=row["entry_id"],
-                bank_id=row["bank_id"],
-                entry_type=row["entry_type"],
-                data=json.loads(row["data"]),
-                created_at=row["created_at"],
-            )
-            for row in rows
-        ]
-        return entries
+            entry = self._cache.get(entry_id)
+            if entry is not None:
+                self._cache.move_to_end(entry_id)
+                return entry
+        row = self._reader().execute(
+            "SELECT * FROM entries WHERE entry_id = ?",
+            (entry_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        entry = self._row_to_entry(row)
+        self._add_cache(entry)
+        return entry
+
+    @staticmethod
+    def _row_to_entry(row: sqlite3.Row) -> MemoryEntry:
+        return MemoryEntry(
+            entry_id=row["entry_id"],
+            bank_id=row["bank_id"],
+            entry_type=row["entry_type"],
+            data=fast_json.loads(row["data"]),
+            created_at=row["created_at"],
+        )
 
     def _add_cache(self, entry: MemoryEntry) -> None:
-        self._cache[entry.entry_id] = entry
-        if len(self._cache) > self._cache_size:
-            # Remove oldest entry based on created_at
-            oldest = min(self._cache.values(), key=lambda e: e.created_at)
-            self._cache.pop(oldest.entry_id, None)
+        with self._lock:
+            self._cache[entry.entry_id] = entry
+            self._cache.move_to_end(entry.entry_id)
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
 
 
 MEMORY_MANAGER = MemoryManager()
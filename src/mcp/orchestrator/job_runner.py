@@ -1,16 +1,24 @@
 from __future__ import annotations
 
+import functools
 import json
 import time
+from collections import deque
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import BinaryIO, Deque, Dict, List, Optional, Set
 
 from mcp.event_bus import EVENT_BUS
 from mcp.memory import MEMORY_MANAGER
-from mcp.orchestrator.planner import Plan, PlanTask
+from mcp.orchestrator.planner import Plan, PlanTask, ensure_str_list, strip_ansi
 from mcp.store import TaskStore
 from mcp.terminal.manager import TaskRecord, TerminalManager
+from mcp.utils import fast_json
+
+_WAIT_GRACE = 5.0
+_EVENTS_BUFFER = 64 * 1024
+# Points de contrôle : le journal est vidé sur disque à chaque fin de tâche.
+_FLUSH_EVENTS = frozenset({"task_completed", "task_failed"})
 
 
 @dataclass
@@ -27,27 +35,25 @@ class ClaimResult:
         execution = payload.get("execution") if isinstance(payload, dict) else {}
         return cls(
             task_id=str(payload.get("task_id") or fallback_task_id),
-            reads=_ensure_str_list(resources.get("reads") if isinstance(resources, dict) else []),
-            writes=_ensure_str_list(resources.get("writes") if isinstance(resources, dict) else []),
-            commands=_ensure_str_list(execution.get("commands") if isinstance(execution, dict) else []),
+            reads=ensure_str_list(resources.get("reads") if isinstance(resources, dict) else []),
+            writes=ensure_str_list(resources.get("writes") if isinstance(resources, dict) else []),
+            commands=ensure_str_list(execution.get("commands") if isinstance(execution, dict) else []),
             raw=payload,
         )
 
 
-def _ensure_str_list(value) -> List[str]:  # noqa: ANN001 - valeur dynamique
-    if isinstance(value, str):
-        return [value]
-    if isinstance(value, list):
-        return [str(v) for v in value if v is not None]
-    return []
+@functools.lru_cache(maxsize=1024)
+def _normalize_path(path: str) -> str:
+    return Path(path).as_posix()
 
 
 class ResourceLocks:
     def __init__(self) -> None:
         self._locks: Dict[str, str] = {}
+        self._by_owner: Dict[str, Set[str]] = {}
 
     def _normalize(self, path: str) -> str:
-        return Path(path).as_posix()
+        return _normalize_path(path)
 
     def can_lock(self, task_id: str, paths: List[str]) -> bool:
         for path in paths:
@@ -58,14 +64,16 @@ class ResourceLocks:
         return True
 
     def acquire(self, task_id: str, paths: List[str]) -> None:
+        owned = self._by_owner.setdefault(task_id, set())
         for path in paths:
             normalized = self._normalize(path)
             self._locks[normalized] = task_id
+            owned.add(normalized)
 
     def release(self, task_id: str) -> None:
-        to_delete = [path for path, owner in self._locks.items() if owner == task_id]
-        for path in to_delete:
-            del self._locks[path]
+        for path in self._by_owner.pop(task_id, ()):
+            if self._locks.get(path) == task_id:
+                del self._locks[path]
 
 
 class JobRunner:
@@ -93,104 +101,127 @@ class JobRunner:
         self.completed: set[str] = set()
         self.locks = ResourceLocks()
         self.blocked: set[str] = set()
+        self._indegree: Dict[str, int] = {}
+        self._dependents: Dict[str, List[str]] = {}
+        for task in self.plan.tasks:
+            self._indegree[task.task_id] = len(task.dependencies)
+            for dep in task.dependencies:
+                self._dependents.setdefault(dep, []).append(task.task_id)
+        self._pending_status: Optional[str] = None
+        # Ouvert au premier événement, dans run() dont le finally le ferme : un échec
+        # de la construction (plan, banque mémoire) ne laisse pas de fichier ouvert.
+        self._events_fp: Optional[BinaryIO] = None
         self.memory_bank_id = memory_bank_id or MEMORY_MANAGER.ensure_bank(f"job-{job_id}")
         self._record_plan()
 
     def run(self) -> None:
-        remaining: Dict[str, PlanTask] = {task.task_id: task for task in self.plan.tasks}
-        if not remaining:
+        tasks: Dict[str, PlanTask] = {task.task_id: task for task in self.plan.tasks}
+        if not tasks:
             raise RuntimeError("Plan vide : aucune tâche à exécuter")
 
-        while remaining:
-            progress = False
-            for task_id, task in list(remaining.items()):
-                if not self._dependencies_satisfied(task):
-                    continue
-                claim = self.claims.get(task_id)
-                if claim is None:
-                    claim = self._analyze_task(task)
-                    self.claims[task_id] = claim
-                    self._persist_claim(claim)
-        self._log_job_event(
-            "claim_recorded",
-            {
-                "task_id": task_id,
-                "resources": {
-                                "reads": claim.reads,
-                                "writes": claim.writes,
-                            },
-                            "commands": claim.commands,
-                        },
-                    )
-                if not self.locks.can_lock(task_id, claim.writes):
-                    if task_id not in self.blocked:
-                self.blocked.add(task_id)
-                self.store.update_fields(self.job_id, status=f"blocked:{task_id}")
+        try:
+            self._run(tasks)
+        finally:
+            self._flush_status()
+            self.close()
+
+    def close(self) -> None:
+        if self._events_fp is not None and not self._events_fp.closed:
+            self._events_fp.close()
+
+    def _run(self, tasks: Dict[str, PlanTask]) -> None:
+        indegree = dict(self._indegree)
+        ready: Deque[str] = deque(task_id for task_id, count in indegree.items() if count == 0)
+        # Tâches prêtes mais bloquées par un verrou : réévaluées à chaque libération.
+        waiting_on_locks: List[str] = []
+
+        while ready:
+            task_id = ready.popleft()
+            task = tasks[task_id]
+            claim = self.claims.get(task_id)
+            if claim is None:
+                claim = self._analyze_task(task)
+                self.claims[task_id] = claim
+                self._persist_claim(claim)
                 self._log_job_event(
-                    "claim_blocked",
+                    "claim_recorded",
                     {
-                                "task_id": task_id,
-                                "waiting_for": claim.writes,
-                            },
-                        )
-                    continue
-                if task_id in self.blocked:
-                    self.blocked.remove(task_id)
+                        "task_id": task_id,
+                        "resources": {
+                            "reads": claim.reads,
+                            "writes": claim.writes,
+                        },
+                        "commands": claim.commands,
+                    },
+                )
+            if not self.locks.can_lock(task_id, claim.writes):
+                if task_id not in self.blocked:
+                    self.blocked.add(task_id)
+                    self._set_status(f"blocked:{task_id}", flush=True)
                     self._log_job_event(
-                        "claim_unblocked",
+                        "claim_blocked",
                         {
                             "task_id": task_id,
+                            "waiting_for": claim.writes,
                         },
                     )
-                self.locks.acquire(task_id, claim.writes)
+                waiting_on_locks.append(task_id)
+                continue
+            if task_id in self.blocked:
+                self.blocked.remove(task_id)
                 self._log_job_event(
-                    "claim_approved",
+                    "claim_unblocked",
+                    {
+                        "task_id": task_id,
+                    },
+                )
+            self.locks.acquire(task_id, claim.writes)
+            self._log_job_event(
+                "claim_approved",
+                {
+                    "task_id": task_id,
+                    "writes": claim.writes,
+                },
+            )
+            try:
+                self._execute_task(task, claim)
+            finally:
+                self.locks.release(task_id)
+                self._log_job_event(
+                    "locks_released",
                     {
                         "task_id": task_id,
                         "writes": claim.writes,
                     },
                 )
-                try:
-                    self._execute_task(task, claim)
-                finally:
-                    self.locks.release(task_id)
-                    self._log_job_event(
-                        "locks_released",
-                        {
-                            "task_id": task_id,
-                            "writes": claim.writes,
-                        },
-                    )
-                self.completed.add(task_id)
-                del remaining[task_id]
-                progress = True
-                break
-            if not progress:
-                # Aucun progrès possible => soit attente d'une dépendance, soit deadlock
-                # On patiente un court instant avant de réévaluer.
-                time.sleep(0.5)
-                # Si aucune dépendance ne devient disponible après plusieurs tours, on échoue.
-                # On peut détecter une impasse si toutes les dépendances sont déjà complétées
-                # mais que les verrous bloquent en continu.
-                if all(self._dependencies_satisfied(task) for task in remaining.values()):
-                    raise RuntimeError("Deadlock : tâches bloquées par des verrous de ressources")
+            self.completed.add(task_id)
+            ready.extend(waiting_on_locks)
+            waiting_on_locks.clear()
+            for dependent in self._dependents.get(task_id, ()):
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    ready.append(dependent)
+
+        if waiting_on_locks:
+            raise RuntimeError("Deadlock : tâches bloquées par des verrous de ressources")
+        pending = [task_id for task_id in tasks if task_id not in self.completed]
+        if pending:
+            raise RuntimeError(f"Dépendances insatisfaisables pour : {', '.join(pending)}")
 
     def _load_plan(self) -> Plan:
         plan_path = self.job_dir / "plan.json"
         if not plan_path.exists():
             raise RuntimeError(f"Plan introuvable pour le job {self.job_id}")
-        data = plan_path.read_text(encoding="utf-8")
-        return Plan.from_json(data)
-
-    def _dependencies_satisfied(self, task: PlanTask) -> bool:
-        return all(dep in self.completed for dep in task.dependencies)
+        # plan.json est écrit depuis Plan.to_dict() : on garde le dict pour _record_plan.
+        self._plan_data = fast_json.loads(plan_path.read_bytes())
+        return Plan.from_dict(self._plan_data)
 
     def _analyze_task(self, task: PlanTask) -> ClaimResult:
-        self.store.update_fields(self.job_id, status=f"analysis:{task.task_id}")
+        self._set_status(f"analysis:{task.task_id}")
         prompt = self._build_claim_prompt(task)
         claim_task_id = f"claim-{self.job_id}-{task.task_id}"
         record = self.manager.create(claim_task_id, prompt, timeout=self.analysis_timeout)
-        self._wait(record)
+        self._wait(record, timeout=self.analysis_timeout)
         if record.status != "succeeded":
             raise RuntimeError(f"Analyse échouée pour {task.task_id}: {record.error or record.status}")
         payload = self._extract_json_output(claim_task_id)
@@ -199,7 +230,7 @@ class JobRunner:
         return claim
 
     def _execute_task(self, task: PlanTask, claim: ClaimResult) -> None:
-        self.store.update_fields(self.job_id, status=f"awaiting_exec:{task.task_id}")
+        self._set_status(f"awaiting_exec:{task.task_id}")
         prompt = self._build_execution_prompt(task, claim)
         exec_task_id = f"exec-{self.job_id}-{task.task_id}"
         record = self.manager.create(
@@ -208,7 +239,7 @@ class JobRunner:
             timeout=self.execution_timeout,
             metadata={"claim": claim.raw},
         )
-        self._wait(record)
+        self._wait(record, timeout=self.execution_timeout)
         if record.status != "succeeded":
             self._log_job_event(
                 "task_failed",
@@ -219,7 +250,7 @@ class JobRunner:
                 },
             )
             raise RuntimeError(f"Exécution échouée pour {task.task_id}: {record.error or record.status}")
-        self.store.update_fields(self.job_id, status=f"executed:{task.task_id}")
+        self._set_status(f"executed:{task.task_id}")
         self._log_job_event(
             "task_completed",
             {
@@ -232,7 +263,7 @@ class JobRunner:
 
     def _persist_claim(self, claim: ClaimResult) -> None:
         claim_path = self.job_dir / f"{claim.task_id}_claim.json"
-        claim_path.write_text(json.dumps(claim.raw, indent=2, ensure_ascii=False), encoding="utf-8")
+        claim_path.write_bytes(fast_json.dumps_bytes(claim.raw, indent=True))
         MEMORY_MANAGER.store(
             bank_id=self.memory_bank_id,
             entry_type="claim",
@@ -246,24 +277,37 @@ class JobRunner:
             },
         )
 
-    def _wait(self, record: TaskRecord) -> None:
-        while record.status == "running":
-            time.sleep(0.2)
+    def _set_status(self, status: str, *, flush: bool = False) -> None:
+        # Les statuts transitoires (executed:a puis analysis:b) sont fusionnés :
+        # on n'écrit qu'aux points d'attente, là où un observateur peut les voir.
+        self._pending_status = status
+        if flush:
+            self._flush_status()
+
+    def _flush_status(self) -> None:
+        if self._pending_status is None:
+            return
+        self.store.update_fields(self.job_id, status=self._pending_status)
+        self._pending_status = None
+
+    def _wait(self, record: TaskRecord, *, timeout: Optional[float] = None) -> None:
+        self._flush_status()
+        # Le watcher applique déjà le timeout ; la marge couvre le temps de reap.
+        record.done.wait(None if timeout is None else timeout + _WAIT_GRACE)
 
     def _extract_json_output(self, task_id: str) -> Dict[str, object]:
-        stdout_text = "".join(self.manager.logs(task_id))
-        text = stdout_text.strip()
+        text = strip_ansi(self.manager.logs_text(task_id)).strip()
         if not text:
             raise RuntimeError("Sortie vide pour l'analyse")
         try:
-            return json.loads(text)
+            return fast_json.loads(text)
         except json.JSONDecodeError:
-            start = text.find("{")
-            end = text.rfind("}")
-            if start == -1 or end == -1:
-                raise RuntimeError("Impossible d'extraire un JSON depuis la sortie Codex")
-            snippet = text[start : end + 1]
-            return json.loads(snippet)
+            pass
+        # Bavardage autour du JSON : on décode l'objet en place.
+        payload = fast_json.extract_object(text)
+        if payload is None:
+            raise RuntimeError("Impossible d'extraire un JSON depuis la sortie Codex")
+        return payload
 
     def _build_claim_prompt(self, task: PlanTask) -> str:
         return (
@@ -300,10 +344,12 @@ class JobRunner:
             "task_id": payload.get("task_id"),
             "payload": payload,
         }
-        path = self.job_dir / "events.ndjson"
-        with path.open("a", encoding="utf-8") as fp:
-            fp.write(json.dumps(event, ensure_ascii=False))
-            fp.write("\n")
+        fp = self._events_fp
+        if fp is None:
+            fp = self._events_fp = (self.job_dir / "events.ndjson").open("ab", buffering=_EVENTS_BUFFER)
+        fp.write(fast_json.dumps_line(event))
+        if event_type in _FLUSH_EVENTS:
+            fp.flush()
         EVENT_BUS.emit(
             f"job.{event_type}",
             {
@@ -323,6 +369,6 @@ class JobRunner:
             entry_type="plan",
             data={
                 "objective": self.objective,
-                "tasks": [task.to_dict() for task in self.plan.tasks],
+                "tasks": self._plan_data.get("tasks", []),
             },
         )
@@ -1,20 +1,65 @@
 from __future__ import annotations
 
 import json
-import time
-import uuid
+import os
+import re
+import secrets
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Mapping, Optional, Tuple
 
 from mcp.terminal.manager import TaskRecord, TerminalManager
+from mcp.utils import fast_json
+
+
+_EMPTY: Dict[str, object] = {}
+
+# Séquences CSI (couleurs, curseur), OSC (titre) et échappements à deux caractères.
+_ANSI_RE = re.compile(r"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])")
+
+_PLAN_CACHE_SIZE = 64
+# Un LRU par portée (fichier de cache ou runs_dir, binaire codex) : le démon sert
+# plusieurs projets et crée un planificateur par job ; un plan, avec ses chemins,
+# ne doit pas passer d'un projet à l'autre.
+# Tâches stockées sérialisées : chaque lecture reconstruit des listes neuves, un plan
+# modifié par l'appelant (rôles, dépendances) ne peut pas altérer le cache.
+_PLAN_CACHES: "Dict[Tuple[str, str], OrderedDict[str, bytes]]" = {}
+_PLAN_CACHE_LOCK = threading.Lock()
+
+
+def strip_ansi(text: str) -> str:
+    """Remove terminal escape sequences emitted by Codex through the PTY."""
+    if "\x1b" not in text:
+        return text
+    return _ANSI_RE.sub("", text)
+
+
+def plan_cache_enabled(environ: Mapping[str, str]) -> bool:
+    """Tell whether ``CODEX_PLAN_CACHE_DISABLE`` in ``environ`` leaves the plan cache on."""
+    return environ.get("CODEX_PLAN_CACHE_DISABLE", "") in ("", "0")
+
+
+def ensure_str_list(value) -> List[str]:  # noqa: ANN001 - valeur dynamique
+    """Coerce a JSON value from Codex into a list of strings."""
+    # Types exacts d'abord : la sortie JSON de Codex ne produit pas de sous-classes.
+    if type(value) is list:
+        if all(type(v) is str for v in value):
+            return value
+        return [v if type(v) is str else str(v) for v in value if v is not None]
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [str(v) for v in value if v is not None]
+    return []
 
 
 class PlanError(RuntimeError):
     """Raised when planning fails or produces invalid output."""
 
 
-@dataclass
+@dataclass(slots=True)
 class PlanTask:
     task_id: str
     summary: str
@@ -39,36 +84,59 @@ class PlanTask:
 
     @classmethod
     def from_dict(cls, payload: Dict[str, object]) -> "PlanTask":
-        task_id = str(payload.get("id") or payload.get("task_id") or uuid.uuid4().hex[:6])
-        summary = str(payload.get("summary") or payload.get("title") or "")
-        description = str(payload.get("description") or payload.get("details") or "")
-        dependencies = cls._ensure_str_list(payload.get("dependencies") or payload.get("requires") or [])
-        resources = payload.get("resources") if isinstance(payload.get("resources"), dict) else {}
-        reads = cls._ensure_str_list(resources.get("reads") if isinstance(resources, dict) else [])
-        writes = cls._ensure_str_list(resources.get("writes") if isinstance(resources, dict) else [])
-        role = str(payload.get("role") or payload.get("agent") or "executor")
-        if not summary:
-            summary = "No summary provided"
+        # Chemin direct pour la forme imposée par le prompt (et par to_dict) ;
+        # les alias et valeurs atypiques passent par _from_loose_dict.
+        try:
+            task_id = payload["id"]
+            summary = payload["summary"]
+            description = payload["description"]
+            dependencies = payload["dependencies"]
+            resources = payload["resources"]
+            reads = resources["reads"]
+            writes = resources["writes"]
+        except (KeyError, TypeError):
+            return cls._from_loose_dict(payload)
+        if not (
+            type(task_id) is str
+            and task_id
+            and type(summary) is str
+            and summary
+            and type(description) is str
+            and type(dependencies) is list
+            and type(reads) is list
+            and type(writes) is list
+        ):
+            return cls._from_loose_dict(payload)
+        ensure = ensure_str_list
         return cls(
             task_id=task_id,
             summary=summary,
             description=description,
-            dependencies=dependencies,
-            reads=reads,
-            writes=writes,
-            role=role,
+            dependencies=ensure(dependencies),
+            reads=ensure(reads),
+            writes=ensure(writes),
+            role=str(payload.get("role") or payload.get("agent") or "executor"),
         )
 
-    @staticmethod
-    def _ensure_str_list(value) -> List[str]:  # noqa: ANN001 - helper
-        if isinstance(value, str):
-            return [value]
-        if isinstance(value, list):
-            return [str(v) for v in value if v is not None]
-        return []
+    @classmethod
+    def _from_loose_dict(cls, payload: Dict[str, object]) -> "PlanTask":
+        get = payload.get
+        ensure = ensure_str_list
+        resources = get("resources")
+        if type(resources) is not dict:
+            resources = _EMPTY
+        return cls(
+            task_id=str(get("id") or get("task_id") or secrets.token_hex(3)),
+            summary=str(get("summary") or get("title") or "No summary provided"),
+            description=str(get("description") or get("details") or ""),
+            dependencies=ensure(get("dependencies") or get("requires") or []),
+            reads=ensure(resources.get("reads")),
+            writes=ensure(resources.get("writes")),
+            role=str(get("role") or get("agent") or "executor"),
+        )
 
 
-@dataclass
+@dataclass(slots=True)
 class Plan:
     objective: str
     tasks: List[PlanTask]
@@ -79,8 +147,13 @@ class Plan:
             "tasks": [task.to_dict() for task in self.tasks],
         }
 
-    def to_json(self, *, indent: int = 2) -> str:
-        return json.dumps(self.to_dict(), indent=indent, ensure_ascii=False)
+    def to_json(self, *, indent: int = 2, data: Optional[Dict[str, object]] = None) -> str:
+        """Serialize the plan; ``data`` reuses an already built ``to_dict()`` result."""
+        if data is None:
+            data = self.to_dict()
+        if indent == 2:
+            return fast_json.dumps_bytes(data, indent=True).decode("utf-8")
+        return json.dumps(data, indent=indent, ensure_ascii=False)
 
     @classmethod
     def from_dict(cls, payload: Dict[str, object]) -> "Plan":
@@ -95,7 +168,7 @@ class Plan:
 
     @classmethod
     def from_json(cls, text: str) -> "Plan":
-        return cls.from_dict(json.loads(text))
+        return cls.from_dict(fast_json.loads(text))
 
 
 class CodexPlanner:
@@ -107,9 +180,23 @@ class CodexPlanner:
         "{{\"objective\": string, \"tasks\": [{{\"id\": string, \"summary\": string, \"description\": string, \"dependencies\": [string], \"resources\": {{\"reads\": [string], \"writes\": [string]}}}}]}}. "
         "Use concise ids (kebab-case)."
     )
+    # Gabarit résolu une fois : seul l'objectif varie d'un appel à l'autre.
+    _PROMPT_PREFIX, _PROMPT_SUFFIX = PROMPT_TEMPLATE.format(objective="\0").split("\0")
 
-    def __init__(self, manager: TerminalManager) -> None:
+    def __init__(
+        self,
+        manager: TerminalManager,
+        *,
+        cache_path: Optional[Path] = None,
+        env: Optional[Mapping[str, str]] = None,
+    ) -> None:
         self._manager = manager
+        # Environnement du client (démon) appliqué aux exécutions codex du planificateur.
+        self._env = dict(env) if env is not None else None
+        self._cache_path = cache_path
+        scope_path = cache_path if cache_path is not None else manager.runs_dir
+        self._cache_scope = (str(Path(scope_path).resolve()), manager.codex_bin)
+        self._disk_loaded = False
 
     def generate_plan(
         self,
@@ -117,14 +204,31 @@ class CodexPlanner:
         objective: str,
         job_id: str,
         timeout: float | None = 120.0,
+        use_cache: Optional[bool] = None,
     ) -> Plan:
-        planner_task_id = f"planner-{job_id}-{uuid.uuid4().hex[:4]}"
-        prompt = self.PROMPT_TEMPLATE.format(objective=objective.strip())
+        """Plan ``objective``; ``use_cache`` defaults to ``CODEX_PLAN_CACHE_DISABLE`` from os.environ."""
+        if use_cache is None:
+            use_cache = plan_cache_enabled(os.environ)
+        key = " ".join(objective.split()).lower()
+        if use_cache:
+            cached = self._cache_get(key)
+            if cached is not None:
+                # Reconstruit les tâches : l'appelant peut modifier le plan (rôles).
+                return Plan(objective=objective, tasks=[PlanTask.from_dict(item) for item in cached])
+        plan = self._generate_plan(objective=objective, job_id=job_id, timeout=timeout)
+        if use_cache:
+            self._cache_put(key, [task.to_dict() for task in plan.tasks])
+        return plan
+
+    def _generate_plan(self, *, objective: str, job_id: str, timeout: float | None) -> Plan:
+        planner_task_id = f"planner-{job_id}-{secrets.token_hex(2)}"
+        prompt = self._PROMPT_PREFIX + objective.strip() + self._PROMPT_SUFFIX
 
         record = self._manager.create(
             planner_task_id,
             prompt,
             mode="exec",
+            env=self._env,
             timeout=timeout,
         )
         self._wait_for_completion(record)
@@ -132,32 +236,87 @@ class CodexPlanner:
         if record.status != "succeeded":
             raise PlanError(f"Planning failed: {record.error or record.status}")
 
-        stdout = "".join(self._manager.logs(planner_task_id))
+        stdout = self._manager.logs_text(planner_task_id)
         data = self._parse_plan_json(stdout)
         plan = self._build_plan(objective, data)
         return plan
 
+    def _cache_get(self, key: str) -> Optional[List[Dict[str, object]]]:
+        with _PLAN_CACHE_LOCK:
+            cache = self._scope_cache()
+            if not self._disk_loaded:
+                self._disk_loaded = True
+                self._load_disk_cache(cache)
+            blob = cache.get(key)
+            if blob is None:
+                return None
+            cache.move_to_end(key)
+        return fast_json.loads(blob)
+
+    def _scope_cache(self) -> "OrderedDict[str, bytes]":
+        cache = _PLAN_CACHES.get(self._cache_scope)
+        if cache is None:
+            cache = _PLAN_CACHES[self._cache_scope] = OrderedDict()
+        return cache
+
+    def _cache_put(self, key: str, tasks: List[Dict[str, object]]) -> None:
+        blob = fast_json.dumps_bytes(tasks)
+        with _PLAN_CACHE_LOCK:
+            cache = self._scope_cache()
+            cache[key] = blob
+            cache.move_to_end(key)
+            while len(cache) > _PLAN_CACHE_SIZE:
+                cache.popitem(last=False)
+            if self._cache_path is None:
+                return
+            entries = list(cache.items())
+        # Objet JSON assemblé à partir des blobs, sans les redécoder.
+        snapshot = b"{" + b",".join(fast_json.dumps_bytes(k) + b":" + v for k, v in entries) + b"}"
+        # Écriture atomique : d'autres processus, ou d'autres jobs du démon, peuvent
+        # écrire en parallèle ; le fichier temporaire est propre au thread.
+        tmp_path = self._cache_path.with_name(
+            f"{self._cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        try:
+            tmp_path.write_bytes(snapshot)
+            os.replace(tmp_path, self._cache_path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+
+    def _load_disk_cache(self, cache: "OrderedDict[str, bytes]") -> None:
+        if self._cache_path is None:
+            return
+        try:
+            stored = fast_json.loads(self._cache_path.read_bytes())
+        except (OSError, json.JSONDecodeError):
+            return
+        if not isinstance(stored, dict):
+            return
+        for key, tasks in reversed(list(stored.items())):
+            if key not in cache and isinstance(tasks, list):
+                cache[key] = fast_json.dumps_bytes(tasks)
+                cache.move_to_end(key, last=False)
+        while len(cache) > _PLAN_CACHE_SIZE:
+            cache.popitem(last=False)
+
     def _wait_for_completion(self, record: TaskRecord) -> None:
-        while record.status == "running":
-            time.sleep(0.2)
+        record.done.wait()
 
     def _parse_plan_json(self, raw: str) -> Dict[str, object]:
-        text = raw.strip()
+        text = strip_ansi(raw).strip()
         if not text:
             raise PlanError("Aucune sortie du planificateur")
 
         try:
-            return json.loads(text)
+            return fast_json.loads(text)
         except json.JSONDecodeError:
-            start = text.find("{")
-            end = text.rfind("}")
-            if start == -1 or end == -1:
-                raise PlanError("Sortie du planificateur illisible") from None
-            snippet = text[start : end + 1]
-            try:
-                return json.loads(snippet)
-            except json.JSONDecodeError as exc:  # pragma: no cover - informationnel
-                raise PlanError("JSON de plan invalide") from exc
+            pass
+        if "{" not in text:
+            raise PlanError("Sortie du planificateur illisible")
+        payload = fast_json.extract_object(text)
+        if payload is None:
+            raise PlanError("JSON de plan invalide")
+        return payload
 
     def _build_plan(self, objective: str, payload: Dict[str, object]) -> Plan:
         tasks_payload = payload.get("tasks") if isinstance(payload, dict) else None
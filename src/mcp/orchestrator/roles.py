@@ -1,19 +1,24 @@
 from __future__ import annotations
 
 import json
+import re
 import textwrap
-import time
-from dataclasses import dataclass
-from typing import Dict, List
+from dataclasses import asdict, dataclass
+from typing import Dict, Mapping, Optional
 
 from mcp.event_bus import EVENT_BUS
-from mcp.orchestrator.planner import Plan, PlanTask
+from mcp.orchestrator.planner import Plan, PlanTask, strip_ansi
 from mcp.terminal.manager import TerminalManager
+from mcp.utils import fast_json
 
 DEFAULT_ROLES = ["queen", "planner", "executor", "reviewer"]
 
+# Mêmes sous-chaînes que l'heuristique d'origine (pas de \b : "planning" reste planner).
+_PLANNER_RE = re.compile(r"plan|spec|analysis", re.IGNORECASE)
+_REVIEWER_RE = re.compile(r"review|test", re.IGNORECASE)
 
-@dataclass
+
+@dataclass(slots=True)
 class RoleAssignment:
     task_id: str
     role: str
@@ -36,70 +41,69 @@ class RolePlanner:
         }}
         """
     ).strip()
+    # Gabarit résolu une fois (les rôles sont fixes) : reste à insérer objectif et tâches.
+    _PROMPT_HEAD, _PROMPT_MIDDLE, _PROMPT_TAIL = PROMPT_TEMPLATE.format(
+        objective="\0", tasks="\0", roles=DEFAULT_ROLES
+    ).split("\0")
 
-    def __init__(self, manager: TerminalManager) -> None:
+    def __init__(self, manager: TerminalManager, *, env: Optional[Mapping[str, str]] = None) -> None:
         self._manager = manager
+        self._env = dict(env) if env is not None else None
 
     def assign(self, plan: Plan, *, job_id: str, timeout: float | None = 90.0) -> Dict[str, RoleAssignment]:
         tasks_blob = "\n".join(
             f"- {task.task_id}: {task.summary}" for task in plan.tasks
         )
-        prompt = self.PROMPT_TEMPLATE.format(
-            objective=plan.objective,
-            tasks=tasks_blob,
-            roles=DEFAULT_ROLES,
-        )
+        prompt = "".join((self._PROMPT_HEAD, plan.objective, self._PROMPT_MIDDLE, tasks_blob, self._PROMPT_TAIL))
         task_id = f"roles-{job_id}"
-        record = self._manager.create(task_id, prompt, timeout=timeout)
-        while record.status == "running":
-            time.sleep(0.2)
+        record = self._manager.create(task_id, prompt, env=self._env, timeout=timeout)
+        record.done.wait()
         if record.status != "succeeded":
             raise RuntimeError(f"Role planning failed: {record.error or record.status}")
-        payload = self._parse(self._manager.logs(task_id))
+        payload = self._parse(self._manager.logs_text(task_id))
         assignments = self._to_assignments(payload, plan)
         EVENT_BUS.emit(
             "job.roles_assigned",
             {
                 "job_id": job_id,
-                "roles": [assignment.__dict__ for assignment in assignments.values()],
+                "roles": [asdict(assignment) for assignment in assignments.values()],
                 "strategy": payload.get("strategy"),
             },
         )
         return assignments
 
-    def _parse(self, logs: List[str]) -> Dict[str, object]:
-        text = "".join(logs).strip()
+    def _parse(self, output: str) -> Dict[str, object]:
+        text = strip_ansi(output).strip()
         if not text:
             raise RuntimeError("Empty role planner output")
         try:
-            return json.loads(text)
+            return fast_json.loads(text)
         except json.JSONDecodeError:
-            start = text.find("{")
-            end = text.rfind("}")
-            if start == -1 or end == -1:
+            payload = fast_json.extract_object(text)
+            if payload is None:
                 raise
-            snippet = text[start : end + 1]
-            return json.loads(snippet)
+            return payload
 
     def _to_assignments(self, payload: Dict[str, object], plan: Plan) -> Dict[str, RoleAssignment]:
         result: Dict[str, RoleAssignment] = {}
         roles = payload.get("roles") if isinstance(payload, dict) else None
         if isinstance(roles, list):
             for entry in roles:
-                if not isinstance(entry, dict):
+                # Sortie contrainte par le schéma du prompt : pas de vérification de type par entrée.
+                try:
+                    task_id = str(entry.get("id") or "").strip()
+                    role = str(entry.get("role") or "").strip().lower()
+                    notes = str(entry.get("notes") or "").strip()
+                except AttributeError:
                     continue
-                task_id = str(entry.get("id") or "").strip()
-                role = str(entry.get("role") or "").strip().lower()
-                notes = str(entry.get("notes") or "").strip()
                 if task_id and role:
                     result[task_id] = RoleAssignment(task_id=task_id, role=role, notes=notes)
         # Fallback heuristic
         if not result:
             for task in plan.tasks:
-                lower = task.summary.lower()
-                if any(keyword in lower for keyword in ("plan", "spec", "analysis")):
+                if _PLANNER_RE.search(task.summary):
                     role = "planner"
-                elif "review" in lower or "test" in lower:
+                elif _REVIEWER_RE.search(task.summary):
                     role = "reviewer"
                 else:
                     role = "executor"
@@ -35,7 +35,7 @@ def main(task_id: str) -> int:
 
     job_dir = _runs_dir / task_id
     job_dir.mkdir(parents=True, exist_ok=True)
-    manager = TerminalManager(runs_dir=job_dir, codex_bin=_codex_bin)
+    manager = TerminalManager(runs_dir=job_dir, codex_bin=_codex_bin, event_store=store)
     _current_manager = manager
     _current_task_id = task_id
 
@@ -63,6 +63,8 @@ def main(task_id: str) -> int:
     except Exception as exc:  # noqa: BLE001
         store.update_fields(task_id, status="failed", error=str(exc))
         raise
+    finally:
+        store.flush()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import os
+import select
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from mcp.utils.proc import open_pidfd
+
+ExitHandler = Callable[[str, Optional[int]], None]
+
+
+def _reap(pidfd: int) -> Optional[int]:
+    """Collect the exit code of a child process; None if it is not our child."""
+    if not hasattr(os, "P_PIDFD"):
+        return None
+    try:
+        result = os.waitid(os.P_PIDFD, pidfd, os.WEXITED)
+    except ChildProcessError:
+        return None
+    if result is None:
+        return None
+    if result.si_code == os.CLD_EXITED:
+        return result.si_status
+    return -result.si_status
+
+
+def _wait_exit_polling(pid: int, timeout: Optional[float]) -> bool:
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        time.sleep(0.1)
+
+
+def wait_exit(pid: int, timeout: Optional[float] = None) -> bool:
+    """Block until ``pid`` exits; False if it is still alive after ``timeout``."""
+    try:
+        pidfd = open_pidfd(pid)
+    except ProcessLookupError:
+        return True
+    if pidfd is None:
+        return _wait_exit_polling(pid, timeout)
+    try:
+        poller = select.poll()
+        poller.register(pidfd, select.POLLIN)
+        return bool(poller.poll(None if timeout is None else timeout * 1000))
+    finally:
+        os.close(pidfd)
+
+
+def is_alive(pid: int) -> bool:
+    return not wait_exit(pid, 0)
+
+
+class WorkerMonitor:
+    """Watch worker processes through pidfds and report their exit from one thread."""
+
+    def __init__(self, on_exit: ExitHandler) -> None:
+        self._on_exit = on_exit
+        self._lock = threading.Lock()
+        self._watched: Dict[int, Tuple[str, int]] = {}
+        self._poller = select.poll()
+        self._wake_r, self._wake_w = os.pipe()
+        self._poller.register(self._wake_r, select.POLLIN)
+        self._thread = threading.Thread(target=self._loop, name="worker-monitor", daemon=True)
+        self._thread.start()
+
+    def watch(self, task_id: str, pid: int) -> bool:
+        """Start watching ``pid``; False if pidfds are unavailable on this host."""
+        try:
+            pidfd = open_pidfd(pid)
+        except ProcessLookupError:
+            self._on_exit(task_id, None)
+            return True
+        if pidfd is None:
+            return False
+        with self._lock:
+            self._watched[pidfd] = (task_id, pid)
+            self._poller.register(pidfd, select.POLLIN)
+        # poll() ne voit les nouveaux fds qu'au prochain appel : on le réveille.
+        os.write(self._wake_w, b"\0")
+        return True
+
+    def _loop(self) -> None:
+        while True:
+            for fd, _ in self._poller.poll():
+                if fd == self._wake_r:
+                    os.read(fd, 512)
+                    continue
+                with self._lock:
+                    task_id, _pid = self._watched.pop(fd)
+                    self._poller.unregister(fd)
+                exit_code = _reap(fd)
+                os.close(fd)
+                try:
+                    self._on_exit(task_id, exit_code)
+                except Exception:  # noqa: BLE001 - le moniteur ne doit pas mourir
+                    continue
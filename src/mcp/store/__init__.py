@@ -1,4 +1,3 @@
-from .sqlite import TaskStore, TaskRow
-
-__all__ = ["TaskStore", "TaskRow"]
+from .sqlite import FINAL_STATUSES, TaskStore, TaskRow
 
+__all__ = ["FINAL_STATUSES", "TaskStore", "TaskRow"]
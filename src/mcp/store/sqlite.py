@@ -1,17 +1,29 @@
 from __future__ import annotations
 
+import atexit
 import os
 import sqlite3
 import threading
 import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from mcp.utils import retry_call
+from mcp.utils.sqlite_pragmas import WAL_PRAGMAS
 
+FINAL_STATUSES = frozenset({"succeeded", "failed", "killed"})
 
-@dataclass
+_PRAGMAS = (
+    # L'attente sur verrou se fait dans SQLite plutôt qu'en réessais Python.
+    "PRAGMA busy_timeout=5000",
+    *WAL_PRAGMAS,
+)
+
+# Délai pendant lequel les mises à jour d'une même tâche sont fusionnées.
+_COALESCE_DELAY = 0.05
+
+
+@dataclass(slots=True)
 class TaskRow:
     task_id: str
     objective: str
@@ -26,18 +38,46 @@ class TaskRow:
 
 
 class TaskStore:
+    @classmethod
+    def instance(cls, db_path: Path | str = "store/tasks.db") -> "TaskStore":
+        """Return the process-wide store bound to the resolved database path."""
+        resolved = Path(os.environ.get("MCP_STORE_PATH", db_path)).resolve()
+        with _INSTANCES_LOCK:
+            store = _INSTANCES.get(resolved)
+            if store is None:
+                store = cls(resolved)
+                _INSTANCES[resolved] = store
+        return store
+
     def __init__(self, db_path: Path | str = "store/tasks.db") -> None:
         resolved_path = Path(os.environ.get("MCP_STORE_PATH", db_path))
         self._db_path = resolved_path
         self._db_path.parent.mkdir(parents=True, exist_ok=True)
-        self._lock = threading.Lock()
-        self._connection = sqlite3.connect(self._db_path, check_same_thread=False)
-        self._connection.row_factory = sqlite3.Row
+        self._local = threading.local()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._pending_events: List[Tuple[str, float, str, str]] = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._writer: Optional[threading.Thread] = None
         self._ensure_schema()
+        atexit.register(self.flush)
+
+    def _conn(self) -> sqlite3.Connection:
+        # Une connexion autocommit par thread : WAL sérialise les écrivains côté SQLite.
+        connection = getattr(self._local, "conn", None)
+        if connection is None:
+            connection = sqlite3.connect(self._db_path, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            for pragma in _PRAGMAS:
+                connection.execute(pragma)
+            self._local.conn = connection
+        return connection
 
     def _ensure_schema(self) -> None:
-        with self._connection:
-            self._connection.execute(
+        connection = self._conn()
+        with connection:
+            connection.execute(
                 """
                 CREATE TABLE IF NOT EXISTS tasks (
                     task_id TEXT PRIMARY KEY,
@@ -53,6 +93,23 @@ class TaskStore:
                 )
                 """
             )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks(created_at DESC)"
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS events (
+                    idx INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id TEXT NOT NULL,
+                    ts REAL NOT NULL,
+                    type TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_events_task_ts ON events(task_id, ts)"
+            )
 
     def upsert_task(
         self,
@@ -66,62 +123,162 @@ class TaskStore:
         exit_code: Optional[int] = None,
         error: Optional[str] = None,
     ) -> None:
+        # Les mises à jour déjà en attente précèdent l'upsert.
+        self.flush()
         now = time.time()
-        def _op() -> None:
-            with self._lock, self._connection:
-                self._connection.execute(
-                    """
-                    INSERT INTO tasks (task_id, objective, command, status, mode, created_at, updated_at, worker_pid, exit_code, error)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(task_id) DO UPDATE SET
-                        objective=excluded.objective,
-                        command=excluded.command,
-                        status=excluded.status,
-                        mode=excluded.mode,
-                        updated_at=excluded.updated_at,
-                        worker_pid=excluded.worker_pid,
-                        exit_code=excluded.exit_code,
-                        error=excluded.error
-                    """,
-                    (
-                        task_id,
-                        objective,
-                        command,
-                        status,
-                        mode,
-                        now,
-                        now,
-                        worker_pid,
-                        exit_code,
-                        error,
-                    ),
-                )
-
-        retry_call(_op, attempts=3, delay=0.2, exceptions=(sqlite3.OperationalError,))
+        self._conn().execute(
+            """
+            INSERT INTO tasks (task_id, objective, command, status, mode, created_at, updated_at, worker_pid, exit_code, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(task_id) DO UPDATE SET
+                objective=excluded.objective,
+                command=excluded.command,
+                status=excluded.status,
+                mode=excluded.mode,
+                updated_at=excluded.updated_at,
+                worker_pid=excluded.worker_pid,
+                exit_code=excluded.exit_code,
+                error=excluded.error
+            """,
+            (
+                task_id,
+                objective,
+                command,
+                status,
+                mode,
+                now,
+                now,
+                worker_pid,
+                exit_code,
+                error,
+            ),
+        )
 
     def update_fields(self, task_id: str, **fields) -> None:
+        """Queue an update; the writer thread commits it within ``_COALESCE_DELAY``."""
         if not fields:
             return
         fields["updated_at"] = time.time()
-        assignments = ", ".join(f"{key} = ?" for key in fields)
-        values = list(fields.values())
-        values.append(task_id)
-        def _op() -> None:
-            with self._lock, self._connection:
-                self._connection.execute(
-                    f"UPDATE tasks SET {assignments} WHERE task_id = ?",
-                    values,
-                )
+        with self._pending_lock:
+            pending = self._pending.get(task_id)
+            if pending is None:
+                self._pending[task_id] = fields
+            else:
+                pending.update(fields)
+            self._start_writer()
+        self._dirty.set()
+
+    def append_event(self, task_id: str, event_type: str, payload: str | bytes, *, ts: Optional[float] = None) -> None:
+        """Queue an event row (``payload`` is JSON); committed with the next batch."""
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8")
+        with self._pending_lock:
+            self._pending_events.append((task_id, ts if ts is not None else time.time(), event_type, payload))
+            self._start_writer()
+        self._dirty.set()
+
+    def _start_writer(self) -> None:
+        # Appelé sous _pending_lock.
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="task-store-writer", daemon=True)
+            self._writer.start()
 
-        retry_call(_op, attempts=3, delay=0.2, exceptions=(sqlite3.OperationalError,))
+    def flush(self) -> None:
+        """Commit every queued update before returning."""
+        # Le verrou couvre prise + commit : flush() ne rend pas la main pendant
+        # qu'un lot pris par le writer n'est pas encore écrit.
+        with self._flush_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                events, self._pending_events = self._pending_events, []
+            if not pending and not events:
+                return
+
+            connection = self._conn()
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    for task_id, fields in pending.items():
+                        assignments = ", ".join(f"{key} = ?" for key in fields)
+                        connection.execute(
+                            f"UPDATE tasks SET {assignments} WHERE task_id = ?",
+                            [*fields.values(), task_id],
+                        )
+                    if events:
+                        connection.executemany(
+                            "INSERT INTO events (task_id, ts, type, payload) VALUES (?, ?, ?, ?)",
+                            events,
+                        )
+                    connection.execute("COMMIT")
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+            except Exception:
+                # On remet le lot en attente sans écraser les valeurs arrivées entre-temps.
+                with self._pending_lock:
+                    for task_id, fields in pending.items():
+                        self._pending[task_id] = {**fields, **self._pending.get(task_id, {})}
+                    self._pending_events[:0] = events
+                raise
+
+    def _write_loop(self) -> None:
+        while True:
+            self._dirty.wait()
+            time.sleep(_COALESCE_DELAY)
+            self._dirty.clear()
+            try:
+                self.flush()
+            except Exception:  # noqa: BLE001 - le writer ne doit jamais mourir
+                self._dirty.set()
 
     def get(self, task_id: str) -> Optional[TaskRow]:
-        cursor = self._connection.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,))
+        cursor = self._conn().execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,))
         row = cursor.fetchone()
         if not row:
             return None
-        return TaskRow(**row)
+        return self._to_row(row)
 
     def list(self) -> List[TaskRow]:
-        cursor = self._connection.execute("SELECT * FROM tasks ORDER BY created_at DESC")
-        return [TaskRow(**row) for row in cursor.fetchall()]
+        cursor = self._conn().execute("SELECT * FROM tasks ORDER BY created_at DESC")
+        return [self._to_row(row) for row in cursor.fetchall()]
+
+    def list_summaries(self) -> List[Tuple[str, str, str, float]]:
+        """Return ``(task_id, status, objective, created_at)`` tuples, newest first."""
+        cursor = self._conn().cursor()
+        # Tuples bruts : pas de sqlite3.Row ni de TaskRow par ligne.
+        cursor.row_factory = None
+        rows = cursor.execute(
+            "SELECT task_id, status, objective, created_at FROM tasks ORDER BY created_at DESC"
+        ).fetchall()
+        with self._pending_lock:
+            if not self._pending:
+                return rows
+            statuses = {task_id: fields["status"] for task_id, fields in self._pending.items() if "status" in fields}
+        return [
+            (task_id, statuses.get(task_id, status), objective, created_at)
+            for task_id, status, objective, created_at in rows
+        ]
+
+    def recent_events(self, task_id: str, limit: int = 100) -> List[Tuple[float, str, str]]:
+        """Return the last ``limit`` ``(ts, type, payload)`` events of a task, oldest first."""
+        self.flush()
+        cursor = self._conn().cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(
+            "SELECT ts, type, payload FROM events WHERE task_id = ? ORDER BY ts DESC, idx DESC LIMIT ?",
+            (task_id, limit),
+        ).fetchall()
+        rows.reverse()
+        return rows
+
+    def _to_row(self, row: sqlite3.Row) -> TaskRow:
+        # Lecture de ses propres écritures : superpose les champs encore en attente.
+        with self._pending_lock:
+            pending = dict(self._pending.get(row["task_id"]) or {})
+        if pending:
+            return TaskRow(**{**dict(row), **pending})
+        return TaskRow(**row)
+
+
+_INSTANCES: Dict[Path, TaskStore] = {}
+_INSTANCES_LOCK = threading.Lock()
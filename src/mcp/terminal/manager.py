@@ -1,22 +1,35 @@
 from __future__ import annotations
 
-import json
+import heapq
 import os
+import secrets
+import selectors
 import subprocess
 import threading
 import time
-import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, Optional
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
 
 from mcp.event_bus import EVENT_BUS
+from mcp.store import TaskStore
 from mcp.terminal.pool import TerminalPool
 from mcp.terminal.session import TerminalSession
-from mcp.utils import CircuitBreaker, CircuitBreakerOpen, retry_call
+from mcp.utils import CircuitBreaker, CircuitBreakerOpen, fast_json, retry_call
+from mcp.utils.proc import open_pidfd
 
+_STDOUT_FLUSH_INTERVAL = 0.2
+# Tampon de stdout.log et events.ndjson : vidés au plus toutes les 200 ms ou à 64 Kio.
+_LOG_BUFFER = 1 << 16
+# Période de sondage des fins de processus quand ni pidfd ni waitid ne sont disponibles.
+_IO_TICK = 0.2
+# Tâches terminées gardées en mémoire (démon longue durée) ; au-delà, logs relus depuis runs/.
+_TASK_HISTORY = 10_000
 
-@dataclass
+
+@dataclass(slots=True)
 class TaskRecord:
     task_id: str
     workdir: Path
@@ -28,6 +41,12 @@ class TaskRecord:
     command: str = ""
     error: Optional[str] = None
     metadata: Dict[str, object] = field(default_factory=dict)
+    done: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+    # str(workdir) calculé une fois : joint à chaque événement publié sur le bus.
+    task_path: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.task_path = str(self.workdir)
 
     @property
     def duration(self) -> Optional[float]:
@@ -36,18 +55,72 @@ class TaskRecord:
         return self.end_time - self.start_time
 
 
+@dataclass(slots=True, eq=False)
+class _Watch:
+    """Per-task state followed by the shared IO thread."""
+
+    task: TaskRecord
+    session: TerminalSession
+    process: subprocess.Popen[bytes]
+    fd: int
+    stdout_file: BinaryIO
+    timeout: Optional[float]
+    deadline: Optional[float]
+    timed_out: bool = False
+    registered: bool = True
+    pidfd: Optional[int] = None
+    last_flush: float = field(default_factory=time.monotonic)
+
+
 class TerminalManager:
     """Manage Codex CLI executions inside reusable PTY sessions."""
 
-    def __init__(self, runs_dir: Path | str = "runs", codex_bin: str = "codex", pool_size: int = 4) -> None:
+    def __init__(
+        self,
+        runs_dir: Path | str = "runs",
+        codex_bin: str = "codex",
+        pool_size: int = 4,
+        *,
+        event_store: Optional[TaskStore] = None,
+    ) -> None:
         self._runs_dir = Path(runs_dir)
         self._runs_dir.mkdir(parents=True, exist_ok=True)
         self._codex_bin = codex_bin
-        self._tasks: Dict[str, TaskRecord] = {}
+        self._base_env: Dict[str, str] = os.environ.copy()
+        self._tasks: "OrderedDict[str, TaskRecord]" = OrderedDict()
         self._processes: Dict[str, TerminalSession] = {}
+        # Avec un store, les événements vont dans sa table ``events`` ; le NDJSON
+        # par tâche n'est conservé qu'avec MCP_EVENTS_NDJSON=1.
+        self._event_store = event_store
+        self._ndjson = event_store is None or os.environ.get("MCP_EVENTS_NDJSON", "") not in ("", "0")
+        self._event_files: Dict[str, BinaryIO] = {}
+        self._events_lock = threading.Lock()
         self._lock = threading.Lock()
-        self._pool = TerminalPool(size=pool_size)
+        self._pool = TerminalPool(size=pool_size, factory=self._new_session)
         self._spawn_breaker = CircuitBreaker("terminal_spawn", threshold=3, cooldown=30.0)
+        # Un seul thread IO multiplexe les PTY de toutes les tâches en cours.
+        self._watches: Set[_Watch] = set()
+        # Index du réacteur : tâches sondées, fins signalées par waitid et tas des échéances,
+        # pour ne pas parcourir toutes les tâches à chaque réveil.
+        self._polled: Set[_Watch] = set()
+        self._exited: Set[_Watch] = set()
+        # Tâches dont stdout.log a des données en tampon (thread IO uniquement).
+        self._unflushed: Set[_Watch] = set()
+        self._deadlines: List[Tuple[float, int, _Watch]] = []
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._io_thread: Optional[threading.Thread] = None
+        self._wake_r = self._wake_w = -1
+        # Fermetures de fichiers/sessions hors du thread IO, qui continue de drainer les autres PTY.
+        self._finalizer = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pty-finalize")
+        self._stopping = False
+
+    @property
+    def runs_dir(self) -> Path:
+        return self._runs_dir
+
+    @property
+    def codex_bin(self) -> str:
+        return self._codex_bin
 
     def create(
         self,
@@ -63,13 +136,14 @@ class TerminalManager:
             raise ValueError(f"Unsupported mode: {mode}")
 
         with self._lock:
+            if self._stopping:
+                raise RuntimeError("TerminalManager arrêté")
             if task_id in self._tasks:
                 raise ValueError(f"Task {task_id} already exists")
 
         workdir = self._runs_dir / task_id
         workdir.mkdir(parents=True, exist_ok=True)
         stdout_path = workdir / "stdout.log"
-        events_path = workdir / "events.ndjson"
 
         task = TaskRecord(
             task_id=task_id,
@@ -79,9 +153,9 @@ class TerminalManager:
             metadata=dict(metadata or {}),
         )
 
-        env_vars = os.environ.copy()
-        if env:
-            env_vars.update(env)
+        # La session attend un environnement complet : les surcharges sont fusionnées
+        # ici. Sans surcharge, la base est partagée en lecture seule par les sessions.
+        env_vars = self._base_env if not env else {**self._base_env, **env}
 
         session = self._checkout_session(workdir, env_vars, timeout)
         try:
@@ -105,9 +179,12 @@ class TerminalManager:
         with self._lock:
             self._tasks[task_id] = task
             self._processes[task_id] = session
+        if self._ndjson:
+            with self._events_lock:
+                self._event_files[task_id] = (workdir / "events.ndjson").open("ab", buffering=_LOG_BUFFER)
 
         self._write_event(
-            events_path,
+            task,
             "started",
             {
                 "pid": process.pid,
@@ -117,15 +194,35 @@ class TerminalManager:
             },
         )
 
-        watcher = threading.Thread(
-            target=self._watch_process,
-            args=(task, session, process, stdout_path, events_path, timeout),
-            daemon=True,
+        self._watch(
+            _Watch(
+                task=task,
+                session=session,
+                process=process,
+                fd=session.master_fd,
+                stdout_file=stdout_path.open("ab", buffering=_LOG_BUFFER),
+                timeout=timeout,
+                deadline=time.time() + timeout if timeout else None,
+            )
         )
-        watcher.start()
 
         return task
 
+    def _new_session(
+        self,
+        workdir: Optional[Path] = None,
+        env: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> TerminalSession:
+        # Sans argument (pré-chauffage), configure() repointe la session à chaque tâche.
+        return TerminalSession(
+            session_id=f"session-{secrets.token_hex(4)}",
+            codex_bin=self._codex_bin,
+            workdir=workdir or self._runs_dir,
+            env=env or self._base_env,
+            timeout=timeout,
+        )
+
     def _checkout_session(
         self,
         workdir: Path,
@@ -135,113 +232,339 @@ class TerminalManager:
         try:
             session = self._pool.acquire(block=False)
         except TimeoutError:
-            session = TerminalSession(
-                session_id=f"session-{uuid.uuid4().hex[:8]}",
-                codex_bin=self._codex_bin,
-                workdir=workdir,
-                env=env,
-                timeout=timeout,
-            )
+            session = self._new_session(workdir, env, timeout)
             session.open()
-            self._pool.add(session)
-            session = self._pool.acquire(block=False)
+            self._pool.add_and_acquire(session)
         session.configure(codex_bin=self._codex_bin, workdir=workdir, env=env, timeout=timeout)
         return session
 
-    def _watch_process(
-        self,
-        task: TaskRecord,
-        session: TerminalSession,
-        process: subprocess.Popen[str],
-        stdout_path: Path,
-        events_path: Path,
-        timeout: Optional[float],
-    ) -> None:
-        deadline = time.time() + timeout if timeout else None
-        timed_out = False
-
-        with stdout_path.open("a", encoding="utf-8") as stdout_file:
-            while True:
-                if deadline and time.time() > deadline:
-                    timed_out = True
-                    if process.poll() is None:
-                        process.terminate()
-                    self._write_event(events_path, "timeout", {"timeout": timeout})
-                    break
-                chunk = session.read(timeout=0.2)
-                if chunk:
-                    stdout_file.write(chunk)
-                    stdout_file.flush()
-                    self._write_event(events_path, "stdout", {"data": chunk})
-                if process.poll() is not None and not chunk:
+    def _ensure_io_thread(self) -> None:
+        with self._lock:
+            if self._io_thread is not None:
+                return
+            self._selector = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            self._selector.register(self._wake_r, selectors.EVENT_READ)
+            self._io_thread = threading.Thread(target=self._io_loop, name="terminal-io", daemon=True)
+            self._io_thread.start()
+
+    def _watch(self, watch: _Watch) -> None:
+        self._ensure_io_thread()
+        try:
+            watch.pidfd = open_pidfd(watch.process.pid)
+        except ProcessLookupError:
+            # Processus déjà terminé : repli sur waitid ou le sondage, comme sans pidfd.
+            watch.pidfd = None
+        with self._lock:
+            self._watches.add(watch)
+            self._selector.register(watch.fd, selectors.EVENT_READ, watch)
+            if watch.pidfd is not None:
+                self._selector.register(watch.pidfd, selectors.EVENT_READ, watch)
+            elif not hasattr(os, "waitid"):
+                self._polled.add(watch)
+            if watch.deadline:
+                heapq.heappush(self._deadlines, (watch.deadline, id(watch), watch))
+        if watch.pidfd is None and hasattr(os, "waitid"):
+            # Sans pidfd : un thread bloqué dans waitid (sans récolter) réveille le réacteur.
+            threading.Thread(target=self._await_exit, args=(watch,), name="pty-waitid", daemon=True).start()
+        # select() ne voit le nouveau fd qu'au prochain appel : on le réveille.
+        os.write(self._wake_w, b"\0")
+
+    def _io_loop(self) -> None:
+        while True:
+            with self._lock:
+                if self._stopping and not self._watches:
                     break
+                # Sans pidfd ni waitid, la fin d'un processus n'est visible qu'en sondant.
+                due: Set[_Watch] = set(self._polled)
+                timeout = _IO_TICK if due else self._next_deadline()
+            if self._unflushed and (timeout is None or timeout > _STDOUT_FLUSH_INTERVAL):
+                # Sortie en tampon : on se réveille pour la vider même si la tâche se tait.
+                timeout = _STDOUT_FLUSH_INTERVAL
+            for key, _ in self._selector.select(timeout):
+                if key.fd == self._wake_r:
+                    try:
+                        os.read(self._wake_r, 512)
+                    except BlockingIOError:
+                        pass
+                elif key.fd == key.data.fd:
+                    self._drain(key.data)
+                else:
+                    # Un pidfd lisible signale la fin du processus.
+                    due.add(key.data)
+            if self._unflushed:
+                self._flush_idle()
+            now = time.time()
+            # Pas de waitpid par tâche à chaque réveil : seulement pidfd signalé,
+            # échéance dépassée ou tâche sans pidfd (sondage).
+            with self._lock:
+                if self._exited:
+                    due |= self._exited
+                    self._exited.clear()
+                while self._deadlines and self._deadlines[0][0] < now:
+                    due.add(heapq.heappop(self._deadlines)[2])
+                # Une tâche déjà finalisée (échéance, waitid tardif) n'est jamais revue.
+                due &= self._watches
+            for watch in due:
+                try:
+                    self._check(watch, now)
+                except Exception:  # noqa: BLE001 - le thread IO ne doit jamais mourir
+                    continue
+        self._selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        self._finalizer.shutdown(wait=False)
+
+    def _await_exit(self, watch: _Watch) -> None:
+        try:
+            # WNOWAIT laisse le zombie : Popen.poll()/wait() récoltent ensuite normalement.
+            os.waitid(os.P_PID, watch.process.pid, os.WEXITED | os.WNOWAIT)
+        except (ChildProcessError, InterruptedError):
+            pass
+        with self._lock:
+            # Tâche déjà finalisée (timeout) : le réacteur a pu s'arrêter et fermer le pipe.
+            if watch not in self._watches:
+                return
+            self._exited.add(watch)
+            os.write(self._wake_w, b"\0")
+
+    def refresh_env(self) -> None:
+        """Snapshot ``os.environ`` again for tasks created from now on."""
+        self._base_env = os.environ.copy()
+
+    def shutdown(self, *, wait: bool = True) -> None:
+        """Refuse new tasks and stop the IO thread once running tasks have finished."""
+        with self._lock:
+            self._stopping = True
+            io_thread = self._io_thread
+            if io_thread is not None:
+                os.write(self._wake_w, b"\0")
+        if io_thread is None:
+            self._finalizer.shutdown(wait=wait)
+            return
+        if wait:
+            io_thread.join()
+            self._finalizer.shutdown(wait=True)
 
-        exit_status = process.wait()
-        session.close()
-        self._pool.release(session)
-
-        task.exit_code = exit_status
-        task.end_time = time.time()
+    def _next_deadline(self) -> Optional[float]:
+        # Appelé sous _lock ; les tâches finies restent dans le tas jusqu'à leur échéance.
+        if not self._deadlines:
+            return None
+        return max(self._deadlines[0][0] - time.time(), 0.0)
 
-        if task.error == "killed":
-            task.status = "failed"
-        elif timed_out:
-            task.status = "failed"
-            task.error = "timeout"
-        elif exit_status == 0:
-            task.status = "succeeded"
-            task.error = None
+    def _drain(self, watch: _Watch) -> bool:
+        try:
+            chunk = watch.session.read_bytes(timeout=0)
+        except OSError:
+            chunk = b""
+        if chunk is None:
+            # Réveil intempestif ou course de lecture (EAGAIN) : le fd reste surveillé.
+            return False
+        if not chunk:
+            # EOF : l'esclave est fermé, la fin du processus est constatée par _check.
+            self._unwatch_fd(watch)
+            return False
+        # Octets bruts dans stdout.log ; décodage uniquement pour l'événement.
+        watch.stdout_file.write(chunk)
+        self._write_event(watch.task, "stdout", {"data": chunk.decode("utf-8", errors="replace")})
+        # Vidage au plus toutes les 200 ms ; une tâche silencieuse est vidée par _flush_idle.
+        now = time.monotonic()
+        if now - watch.last_flush > _STDOUT_FLUSH_INTERVAL:
+            self._flush_watch(watch, now)
         else:
-            task.status = "failed"
-            task.error = f"exit_code={exit_status}"
-
-        self._write_event(events_path, "exit", {"exit_code": exit_status})
+            self._unflushed.add(watch)
+        return True
+
+    def _flush_watch(self, watch: _Watch, now: float) -> None:
+        watch.stdout_file.flush()
+        self._flush_events(watch.task.task_id)
+        watch.last_flush = now
+        self._unflushed.discard(watch)
+
+    def _flush_idle(self) -> None:
+        now = time.monotonic()
+        for watch in [w for w in self._unflushed if now - w.last_flush >= _STDOUT_FLUSH_INTERVAL]:
+            try:
+                self._flush_watch(watch, now)
+            except (OSError, ValueError):
+                self._unflushed.discard(watch)
+
+    def _check(self, watch: _Watch, now: float) -> None:
+        if watch.deadline and now > watch.deadline and not watch.timed_out:
+            watch.timed_out = True
+            if watch.process.poll() is None:
+                watch.process.terminate()
+            self._write_event(watch.task, "timeout", {"timeout": watch.timeout})
+            self._unwatch_fd(watch)
+        if watch.process.poll() is None:
+            return
+        # Dernière sortie éventuelle avant de finaliser.
+        while watch.registered and self._drain(watch):
+            pass
+        self._unwatch_fd(watch)
+        # La fermeture des fichiers par _finalize vide le reste.
+        self._unflushed.discard(watch)
+        with self._lock:
+            self._watches.discard(watch)
+            self._polled.discard(watch)
+            if watch.pidfd is not None:
+                self._selector.unregister(watch.pidfd)
+        if watch.pidfd is not None:
+            os.close(watch.pidfd)
+        self._finalizer.submit(self._finalize, watch)
+
+    def _unwatch_fd(self, watch: _Watch) -> None:
+        if not watch.registered:
+            return
+        watch.registered = False
+        with self._lock:
+            self._selector.unregister(watch.fd)
 
+    def _finalize(self, watch: _Watch) -> None:
+        task, session = watch.task, watch.session
         with self._lock:
-            self._processes.pop(task.task_id, None)
-            self._tasks[task.task_id] = task
-
-    def _write_event(self, path: Path, event_type: str, payload: Dict[str, object]) -> None:
-        event = {
-            "ts": time.time(),
-            "type": event_type,
-            "payload": payload,
-        }
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with path.open("a", encoding="utf-8") as fp:
-            fp.write(json.dumps(event, ensure_ascii=False))
-            fp.write("\n")
-        EVENT_BUS.emit(
-            f"terminal.{event_type}",
-            {
-                "task_path": str(path.parent),
-                **payload,
-            },
-        )
+            # Le premier à retirer la session de _processes gagne : kill() ou la fin naturelle.
+            killed = self._processes.pop(task.task_id, None) is None
+        # Exécuté sur l'exécuteur sans que personne ne lise le futur : done doit être
+        # posé même si une fermeture échoue, sinon les attentes sans timeout bloquent.
+        try:
+            exit_status = watch.process.wait()
+            task.exit_code = exit_status
+            task.end_time = time.time()
+
+            if killed:
+                task.status = "failed"
+                task.error = "killed"
+            elif watch.timed_out:
+                task.status = "failed"
+                task.error = "timeout"
+            elif exit_status == 0:
+                task.status = "succeeded"
+                task.error = None
+            else:
+                task.status = "failed"
+                task.error = f"exit_code={exit_status}"
+
+            watch.stdout_file.close()
+            session.close()
+            self._pool.release(session)
 
-    def logs(self, task_id: str) -> Iterable[str]:
+            self._write_event(task, "exit", {"exit_code": exit_status})
+            with self._events_lock:
+                events_fp = self._event_files.pop(task.task_id, None)
+                if events_fp is not None:
+                    events_fp.close()
+        finally:
+            if task.status == "running":
+                task.status = "failed"
+                task.error = "finalize_error"
+                task.end_time = time.time()
+            with self._lock:
+                self._tasks[task.task_id] = task
+                if len(self._tasks) > _TASK_HISTORY:
+                    self._evict_finished()
+            task.done.set()
+
+    def _flush_events(self, task_id: str) -> None:
+        if not self._ndjson:
+            return
+        with self._events_lock:
+            fp = self._event_files.get(task_id)
+            if fp is not None:
+                fp.flush()
+
+    def _evict_finished(self) -> None:
+        # Appelé sous _lock ; ordre de création, les tâches en cours sont conservées.
+        excess = len(self._tasks) - _TASK_HISTORY
+        victims: List[str] = []
+        for task_id, task in self._tasks.items():
+            if len(victims) >= excess:
+                break
+            if task.done.is_set():
+                victims.append(task_id)
+        for task_id in victims:
+            del self._tasks[task_id]
+
+    def _write_event(self, task: TaskRecord, event_type: str, payload: Dict[str, object]) -> None:
+        ts = time.time()
+        if self._event_store is not None:
+            self._event_store.append_event(task.task_id, event_type, fast_json.dumps_bytes(payload), ts=ts)
+        if self._ndjson:
+            event = {
+                "ts": ts,
+                "type": event_type,
+                "payload": payload,
+            }
+            line = fast_json.dumps_line(event)
+            with self._events_lock:
+                fp = self._event_files.get(task.task_id)
+                if fp is not None:
+                    fp.write(line)
+                    # Événements de cycle de vie (rares) visibles tout de suite ;
+                    # les stdout suivent le vidage du thread IO (_drain, _flush_idle).
+                    if event_type != "stdout":
+                        fp.flush()
+                else:
+                    # Tâche terminée (métadonnées posées après coup) : écriture ponctuelle.
+                    with (task.workdir / "events.ndjson").open("ab") as late_fp:
+                        late_fp.write(line)
+        # Les appelants passent un dict neuf, déjà sérialisé : on le complète sur place.
+        payload["task_path"] = task.task_path
+        EVENT_BUS.emit(f"terminal.{event_type}", payload)
+
+    def wait(self, task_id: str, timeout: Optional[float] = None) -> bool:
+        """Block until the task's process has been reaped; False on timeout."""
         task = self._tasks.get(task_id)
         if not task:
             raise KeyError(f"Unknown task {task_id}")
-        stdout_path = task.workdir / "stdout.log"
-        if not stdout_path.exists():
-            return []
-        with stdout_path.open("r", encoding="utf-8") as fp:
-            return fp.readlines()
+        return task.done.wait(timeout)
+
+    def logs(self, task_id: str) -> Iterator[str]:
+        """Yield stdout lines lazily; prefer ``logs_text`` to get the whole output."""
+        return self._iter_lines(self._stdout_path(task_id))
+
+    def logs_text(self, task_id: str) -> str:
+        stdout_path = self._stdout_path(task_id)
+        try:
+            return stdout_path.read_text(encoding="utf-8", errors="replace")
+        except FileNotFoundError:
+            return ""
+
+    def _stdout_path(self, task_id: str) -> Path:
+        task = self._tasks.get(task_id)
+        if task:
+            return task.workdir / "stdout.log"
+        # Tâche évincée de l'historique : ses logs restent sur disque.
+        workdir = self._runs_dir / task_id
+        if not workdir.is_dir():
+            raise KeyError(f"Unknown task {task_id}")
+        return workdir / "stdout.log"
+
+    @staticmethod
+    def _iter_lines(stdout_path: Path) -> Iterator[str]:
+        try:
+            fp = stdout_path.open("r", encoding="utf-8", errors="replace")
+        except FileNotFoundError:
+            return
+        with fp:
+            yield from fp
 
     def kill(self, task_id: str) -> None:
         with self._lock:
-            session = self._processes.get(task_id)
+            # Même transition que _finalize : une seule des deux retire la session.
+            session = self._processes.pop(task_id, None)
             task = self._tasks.get(task_id)
-        if not session or not task or not session.process:
+            process = session.process if session else None
+        if not session or not task or not process:
             return
-        session.process.terminate()
-        session.close()
-        self._pool.remove(session.session_id)
         task.status = "failed"
         task.error = "killed"
         task.end_time = time.time()
-        self._write_event(task.workdir / "events.ndjson", "killed", {"signal": "SIGTERM"})
+        self._write_event(task, "killed", {"signal": "SIGTERM"})
+        process.terminate()
+        # Le thread IO ferme la session en constatant la fin du processus.
+        self._pool.remove(session.session_id)
 
     def status(self, task_id: str) -> TaskRecord:
         task = self._tasks.get(task_id)
@@ -260,7 +583,7 @@ class TerminalManager:
                 raise KeyError(f"Unknown task {task_id}")
             task.metadata.update(fields)
         self._write_event(
-            task.workdir / "events.ndjson",
+            task,
             "metadata",
             {"updates": fields},
         )
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
-import queue
 import threading
+import time
+from collections import deque
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Callable, Deque, Dict, Optional
 
 from mcp.event_bus import EVENT_BUS
 from mcp.terminal.session import TerminalSession
@@ -18,18 +19,36 @@ class PooledTerminal:
 class TerminalPool:
     """Simple terminal pool managing reusable Codex PTY sessions."""
 
-    def __init__(self, size: int) -> None:
+    def __init__(self, size: int, *, factory: Optional[Callable[[], TerminalSession]] = None) -> None:
         self._size = size
         self._lock = threading.Lock()
+        # Un seul verrou pour les sessions et la file libre ; notify seulement si un thread attend.
+        self._released = threading.Condition(self._lock)
+        self._waiters = 0
         self._pool: Dict[str, PooledTerminal] = {}
-        self._available = queue.Queue[TerminalSession]()
+        self._available: Deque[TerminalSession] = deque()
+        if factory is not None and size > 0:
+            # Pré-chauffage hors du chemin critique : les premières tâches trouvent un PTY ouvert.
+            threading.Thread(target=self._prewarm, args=(factory,), name="pty-prewarm", daemon=True).start()
+
+    def _prewarm(self, factory: Callable[[], TerminalSession]) -> None:
+        for _ in range(self._size):
+            with self._lock:
+                if len(self._pool) >= self._size:
+                    return
+            try:
+                session = factory()
+                session.open()
+            except OSError:
+                return
+            self.add(session)
 
     def add(self, session: TerminalSession) -> None:
         with self._lock:
             if session.session_id in self._pool:
                 raise ValueError(f"Session {session.session_id} already in pool")
             self._pool[session.session_id] = PooledTerminal(session=session)
-            self._available.put(session)
+            self._push(session)
             EVENT_BUS.emit(
                 "terminal.pool_added",
                 {
@@ -37,22 +56,52 @@ class TerminalPool:
                 },
             )
 
-    def acquire(self, *, block: bool = True, timeout: Optional[float] = None) -> TerminalSession:
-        try:
-            session = self._available.get(block=block, timeout=timeout)
-        except queue.Empty as exc:
-            raise TimeoutError("No available terminal session") from exc
+    def add_and_acquire(self, session: TerminalSession) -> TerminalSession:
+        """Insert a fresh session already marked in use, bypassing the free queue."""
         with self._lock:
-            record = self._pool.get(session.session_id)
-            if not record:
-                raise RuntimeError("Pool inconsistency: session missing")
-            record.in_use = True
+            if session.session_id in self._pool:
+                raise ValueError(f"Session {session.session_id} already in pool")
+            self._pool[session.session_id] = PooledTerminal(session=session, in_use=True)
         EVENT_BUS.emit(
-            "terminal.pool_acquired",
+            "terminal.pool_added",
             {
                 "session_id": session.session_id,
             },
         )
+        if EVENT_BUS.has_subscribers("terminal.pool_acquired"):
+            EVENT_BUS.emit(
+                "terminal.pool_acquired",
+                {
+                    "session_id": session.session_id,
+                },
+            )
+        return session
+
+    def acquire(self, *, block: bool = True, timeout: Optional[float] = None) -> TerminalSession:
+        with self._lock:
+            session = self._take()
+            if session is None and block:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                self._waiters += 1
+                try:
+                    while session is None:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            break
+                        self._released.wait(remaining)
+                        session = self._take()
+                finally:
+                    self._waiters -= 1
+            if session is None:
+                raise TimeoutError("No available terminal session")
+        # Chemin chaud : ni dict ni dispatch tant que personne n'écoute.
+        if EVENT_BUS.has_subscribers("terminal.pool_acquired"):
+            EVENT_BUS.emit(
+                "terminal.pool_acquired",
+                {
+                    "session_id": session.session_id,
+                },
+            )
         return session
 
     def release(self, session: TerminalSession) -> None:
@@ -61,13 +110,32 @@ class TerminalPool:
             if not record:
                 return
             record.in_use = False
-        self._available.put(session)
-        EVENT_BUS.emit(
-            "terminal.pool_released",
-            {
-                "session_id": session.session_id,
-            },
-        )
+            self._push(session)
+        if EVENT_BUS.has_subscribers("terminal.pool_released"):
+            EVENT_BUS.emit(
+                "terminal.pool_released",
+                {
+                    "session_id": session.session_id,
+                },
+            )
+
+    def _push(self, session: TerminalSession) -> None:
+        # Appelé sous _lock.
+        self._available.append(session)
+        if self._waiters:
+            self._released.notify()
+
+    def _take(self) -> Optional[TerminalSession]:
+        # Appelé sous _lock ; LIFO pour réutiliser la session la plus chaude.
+        available = self._available
+        while available:
+            session = available.pop()
+            record = self._pool.get(session.session_id)
+            # Session retirée du pool entre-temps : ignorée.
+            if record is not None and not record.in_use:
+                record.in_use = True
+                return session
+        return None
 
     def remove(self, session_id: str) -> None:
         with self._lock:
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+import errno
 import os
 import pty
-import selectors
+import select
 import subprocess
 import threading
 from pathlib import Path
@@ -10,9 +11,18 @@ from typing import Dict, Optional
 
 from mcp.event_bus import EVENT_BUS
 
+_READ_SIZE = 64 * 1024
+# Borne d'un drain : au-delà on rend la main pour émettre un événement.
+_DRAIN_MAX = 256 * 1024
+
 
 class TerminalSession:
-    """Reusable PTY session wrapping Codex CLI invocations."""
+    """Reusable PTY session wrapping Codex CLI invocations.
+
+    ``env`` is the complete environment of the spawned process, not a set of
+    overrides: callers merge their overrides onto a base environment first, as
+    TerminalManager does. An empty ``env`` inherits ``os.environ``.
+    """
 
     def __init__(
         self,
@@ -30,8 +40,11 @@ class TerminalSession:
         self.timeout = timeout
         self._master_fd: Optional[int] = None
         self._slave_fd: Optional[int] = None
-        self.process: Optional[subprocess.Popen[str]] = None
-        self._lock = threading.RLock()
+        # Enregistré une fois par PTY plutôt qu'un sélecteur neuf à chaque lecture.
+        self._poller: Optional[select.poll] = None
+        self.process: Optional[subprocess.Popen[bytes]] = None
+        # Protège uniquement les transitions d'état ; read/write n'y touchent pas.
+        self._lock = threading.Lock()
 
     def configure(
         self,
@@ -53,11 +66,24 @@ class TerminalSession:
 
     def open(self) -> None:
         with self._lock:
-            if self._master_fd is not None:
+            if not self._open_pty():
                 return
-            master_fd, slave_fd = pty.openpty()
-            self._master_fd = master_fd
-            self._slave_fd = slave_fd
+        self._emit_opened()
+
+    def _open_pty(self) -> bool:
+        # Appelé sous _lock ; False si le PTY est déjà ouvert.
+        if self._master_fd is not None:
+            return False
+        master_fd, slave_fd = pty.openpty()
+        # Maître non bloquant : read() vide le PTY jusqu'à EAGAIN sans poll intermédiaire.
+        os.set_blocking(master_fd, False)
+        self._master_fd = master_fd
+        self._slave_fd = slave_fd
+        self._poller = select.poll()
+        self._poller.register(master_fd, select.POLLIN)
+        return True
+
+    def _emit_opened(self) -> None:
         EVENT_BUS.emit(
             "terminal.session_opened",
             {
@@ -69,6 +95,7 @@ class TerminalSession:
     def close(self) -> None:
         with self._lock:
             if self._master_fd is not None:
+                self._poller = None
                 try:
                     os.close(self._master_fd)
                 except OSError:
@@ -88,27 +115,31 @@ class TerminalSession:
             },
         )
 
-    def spawn_exec(self, command: str) -> subprocess.Popen[str]:
+    def spawn_exec(self, command: str) -> subprocess.Popen[bytes]:
         with self._lock:
             if self.process and self.process.poll() is None:
                 raise RuntimeError("Session already running a process")
+            opened = False
             if self._master_fd is None or self._slave_fd is None:
-                self.open()
-            env = os.environ.copy()
-            env.update(self.env)
+                opened = self._open_pty()
             process = subprocess.Popen(
                 [self.codex_bin, "exec", command],
                 stdin=self._slave_fd,
                 stdout=self._slave_fd,
                 stderr=self._slave_fd,
                 cwd=str(self.workdir),
-                env=env,
-                text=True,
-                close_fds=True,
+                # Environnement complet (surcharges déjà fusionnées par l'appelant, pas
+                # de copie de os.environ par lancement) ; vide : hérité du processus.
+                env=self.env or None,
+                # Maîtres PTY, pidfds et pipes sont non héritables (PEP 446) : le fils
+                # n'a pas à parcourir ses fds, seul l'esclave dupliqué sur 0-2 passe l'exec.
+                close_fds=False,
             )
             os.close(self._slave_fd)
             self._slave_fd = None
             self.process = process
+        if opened:
+            self._emit_opened()
         EVENT_BUS.emit(
             "terminal.session_spawn",
             {
@@ -120,27 +151,48 @@ class TerminalSession:
         return process
 
     def read(self, *, timeout: float = 0.2) -> str:
-        with self._lock:
-            if self._master_fd is None:
-                return ""
-            selector = selectors.DefaultSelector()
-            selector.register(self._master_fd, selectors.EVENT_READ)
-            data = ""
+        return (self.read_bytes(timeout=timeout) or b"").decode("utf-8", errors="replace")
+
+    def read_bytes(self, *, timeout: float = 0.2) -> Optional[bytes]:
+        """Drain the PTY and return the raw bytes; empty on EOF, None when nothing is ready yet."""
+        # Sans verrou : un seul lecteur (le thread IO), et close() n'intervient
+        # qu'après la fin du processus. Un fd fermé entre-temps lève OSError.
+        fd, poller = self._master_fd, self._poller
+        if fd is None or poller is None:
+            return b""
+        if timeout > 0 and not poller.poll(timeout * 1000):
+            return None
+        buffer = bytearray()
+        # On vide tout ce qui est disponible avant de rendre un seul bloc.
+        while len(buffer) < _DRAIN_MAX:
             try:
-                ready = selector.select(timeout)
-                if ready:
-                    chunk = os.read(self._master_fd, 4096)
-                    if chunk:
-                        data = chunk.decode("utf-8", errors="replace")
-            finally:
-                selector.unregister(self._master_fd)
-            return data
+                chunk = os.read(fd, _READ_SIZE)
+            except BlockingIOError:
+                # Réveil sans données (EAGAIN) : ce n'est pas une fin de flux.
+                if not buffer:
+                    return None
+                break
+            except OSError as exc:
+                # Linux renvoie EIO sur le maître une fois l'esclave fermé.
+                if exc.errno != errno.EIO:
+                    raise
+                break
+            if not chunk:
+                break
+            buffer += chunk
+        return bytes(buffer)
 
     def write(self, data: str) -> None:
-        with self._lock:
-            if self._master_fd is None:
-                raise RuntimeError("Session not available")
-            os.write(self._master_fd, data.encode("utf-8"))
+        fd = self._master_fd
+        if fd is None:
+            raise RuntimeError("Session not available")
+        pending = memoryview(data.encode("utf-8"))
+        while pending:
+            try:
+                pending = pending[os.write(fd, pending):]
+            except BlockingIOError:
+                # Tampon du PTY plein (maître non bloquant) : on attend qu'il se vide.
+                select.select([], [fd], [])
 
     @property
     def master_fd(self) -> int:
@@ -0,0 +1,59 @@
+"""JSON helpers backed by orjson when installed, stdlib json otherwise."""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, Optional
+
+try:  # pragma: no cover - dépend de l'environnement
+    import orjson
+except ImportError:  # pragma: no cover - fallback stdlib
+    orjson = None  # type: ignore[assignment]
+
+# orjson n'a pas d'équivalent à raw_decode : l'extraction reste sur le décodeur stdlib.
+_DECODER = json.JSONDecoder()
+_OBJECT_START_RE = re.compile(r'\{\s*["}]')
+_EXTRACT_MAX_ATTEMPTS = 64
+
+
+def dumps_bytes(obj: Any, *, indent: bool = False) -> bytes:
+    """Serialize ``obj`` to UTF-8 JSON bytes (2-space indent when ``indent``)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode("utf-8")
+
+
+def dumps_line(obj: Any) -> bytes:
+    """Serialize ``obj`` as one NDJSON line (trailing newline included)."""
+    if orjson is not None:
+        # Newline ajouté par orjson : pas de seconde copie pour concaténer "\n".
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def loads(data: str | bytes) -> Any:
+    """Parse JSON; errors are ``json.JSONDecodeError`` (orjson subclasses it)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def extract_object(text: str) -> Optional[Dict[str, Any]]:
+    """Decode the first JSON object embedded in ``text``; None when there is none."""
+    # Sans découper de sous-chaîne, et seulement depuis un '{' qui peut ouvrir un
+    # objet ('{"' ou '{}') : les accolades du bruit (ANSI, code) sont ignorées.
+    # Chaque échec coûte O(position) (JSONDecodeError calcule ligne et colonne),
+    # d'où le plafond de tentatives qui garde l'extraction linéaire.
+    match = _OBJECT_START_RE.search(text)
+    attempts = 0
+    while match is not None and attempts < _EXTRACT_MAX_ATTEMPTS:
+        start = match.start()
+        try:
+            payload, _ = _DECODER.raw_decode(text, start)
+        except json.JSONDecodeError:
+            attempts += 1
+            match = _OBJECT_START_RE.search(text, start + 1)
+            continue
+        return payload
+    return None
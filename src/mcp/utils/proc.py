@@ -0,0 +1,22 @@
+"""Process helpers shared by the terminal manager and the worker monitor."""
+
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+
+def open_pidfd(pid: int) -> Optional[int]:
+    """Return a pidfd for ``pid``, or None when pidfds are unsupported.
+
+    Raises ProcessLookupError when the process no longer exists.
+    """
+    if not hasattr(os, "pidfd_open"):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except ProcessLookupError:
+        raise
+    except OSError:
+        # ENOSYS (noyau < 5.3) ou EPERM (seccomp) : l'appelant se replie sur le sondage.
+        return None
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import threading
 import time
-from typing import Callable, Iterable, Optional, Type, TypeVar
+from typing import Callable, Iterable, Optional, Tuple, Type, TypeVar
 
 T = TypeVar("T")
 
+_DEFAULT_CATCHES: Tuple[Type[BaseException], ...] = (Exception,)
+
 
 class CircuitBreakerOpen(RuntimeError):
     """Raised when a circuit breaker is open."""
@@ -23,20 +26,27 @@ class CircuitBreaker:
         self.cooldown = cooldown
         self._failure_count = 0
         self._opened_until: float = 0.0
+        # Ne protège que les transitions ; le succès sur circuit sain n'écrit rien.
+        self._lock = threading.Lock()
 
     def allow(self) -> None:
-        if time.time() < self._opened_until:
+        # Circuit fermé (cas courant) : pas d'appel à time.time().
+        if self._opened_until and time.time() < self._opened_until:
             raise CircuitBreakerOpen(f"Circuit '{self.name}' open until {self._opened_until}")
 
     def record_success(self) -> None:
-        self._failure_count = 0
-        self._opened_until = 0.0
+        if not self._failure_count and not self._opened_until:
+            return
+        with self._lock:
+            self._failure_count = 0
+            self._opened_until = 0.0
 
     def record_failure(self) -> None:
-        self._failure_count += 1
-        if self._failure_count >= self.threshold:
-            self._opened_until = time.time() + self.cooldown
-            self._failure_count = 0
+        with self._lock:
+            self._failure_count += 1
+            if self._failure_count >= self.threshold:
+                self._opened_until = time.time() + self.cooldown
+                self._failure_count = 0
 
 
 def retry_call(
@@ -49,18 +59,20 @@ def retry_call(
 ) -> T:
     if attempts < 1:
         raise ValueError("attempts must be >= 1")
-    catches = tuple(exceptions or (Exception,))
-    last_exc: Optional[BaseException] = None
+    catches = tuple(exceptions) if exceptions else _DEFAULT_CATCHES
+    # Premier essai hors de la boucle : le cas nominal ne paie ni range ni backoff.
+    try:
+        return func()
+    except catches:  # type: ignore[misc]
+        if attempts == 1:
+            raise
     current_delay = delay
-    for attempt in range(1, attempts + 1):
+    for attempt in range(2, attempts + 1):
+        time.sleep(current_delay)
+        current_delay *= backoff
         try:
             return func()
-        except catches as exc:  # type: ignore[misc]
-            last_exc = exc
+        except catches:  # type: ignore[misc]
             if attempt == attempts:
                 raise
-            time.sleep(current_delay)
-            current_delay *= backoff
-    assert last_exc is not None
-    raise last_exc
-
+    raise AssertionError("unreachable")
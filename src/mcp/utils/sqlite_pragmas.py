@@ -0,0 +1,13 @@
+"""Connection pragmas shared by the SQLite-backed stores."""
+
+from __future__ import annotations
+
+# WAL : lecteurs concurrents d'un écrivain ; NORMAL suffit en WAL (pas de corruption,
+# seules les dernières transactions peuvent être perdues sur coupure de courant).
+WAL_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)